@@ -1,11 +1,7 @@
 import pandas as pd
-import pandas_datareader.data as web
 from datetime import datetime
-import statsmodels.tsa.stattools as ts
 from numpy import cumsum, log, polyfit, sqrt, std, subtract
 from numpy.random import randn
-import matplotlib.pyplot as plt
-from pandas.plotting import register_matplotlib_converters
 
 
 def hurst(ts):
@@ -49,6 +45,11 @@ def hurst(ts):
 # print("Hurst(Tr): {}".format(hurst(tr)))
 
 if __name__ == "__main__":
+    # only needed for the research script, hurst can be imported without them
+    import pandas_datareader.data as web
+    import statsmodels.tsa.stattools as ts
+    import matplotlib.pyplot as plt
+    from pandas.plotting import register_matplotlib_converters
 
     register_matplotlib_converters()
     # import data as df
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+
+class Alignment:
+    """
+        Aligns many symbols, each with its own datetimes, onto one master calendar
+
+        Data:
+            calendar:
+                Type:
+                    numpy datetime64[ns] array
+                Description:
+                    sorted union of the datetimes of every symbol
+            positions:
+                Type:
+                    numpy int64 array of shape (len(calendar), n_symbols)
+                Description:
+                    row of each symbol's own data to use at each calendar datetime,
+                    the last row at or before it (pad forward), -1 before the symbol lists
+            listed:
+                Type:
+                    numpy bool array of shape (len(calendar), n_symbols)
+                Description:
+                    True once the symbol has its first bar
+    """
+
+    def __init__(self, indexes, start_date=None, end_date=None, warmup_bars=0):
+        """
+            Params:
+                indexes:
+                    list of sorted, unique datetime indexes, one per symbol
+                start_date, end_date:
+                    optional bounds the calendar is cut to, pad forward still uses
+                    rows from before start_date
+                warmup_bars:
+                    number of calendar bars before start_date kept as history,
+                    self.warmup_bars is how many were actually available
+        """
+        times = [np.asarray(index, dtype="datetime64[ns]").view("i8") for index in indexes]
+        lengths = np.array([len(t) for t in times], dtype=np.int64)
+        all_times = np.concatenate(times) if times else np.empty(0, dtype=np.int64)
+
+        calendar = np.unique(all_times)
+        first = 0
+        last = len(calendar)
+        if start_date is not None:
+            first = np.searchsorted(calendar, pd.Timestamp(start_date).value)
+        self.warmup_bars = min(warmup_bars, first)
+        first -= self.warmup_bars
+        if end_date is not None:
+            last = np.searchsorted(calendar, pd.Timestamp(end_date).value, side="right")
+
+        # mark each symbol's own row number at its calendar slot, then pad forward
+        # with a running max down the calendar, rows are increasing in time
+        symbol_ids = np.repeat(np.arange(len(times)), lengths)
+        own_rows = np.arange(len(all_times)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = np.full((len(calendar), len(times)), -1, dtype=np.int64)
+        positions[np.searchsorted(calendar, all_times), symbol_ids] = own_rows
+        np.maximum.accumulate(positions, axis=0, out=positions)
+
+        self.calendar = calendar[first:last].view("datetime64[ns]")
+        self.positions = positions[first:last]
+        self.listed = self.positions >= 0
+
+    def align(self, j, values):
+        """
+            returns values of symbol j laid out on the calendar as a new float64 array,
+            nan where the symbol is not yet listed, all nan for a symbol with no rows
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return np.full(len(self.calendar), np.nan)
+        out = values.take(np.maximum(self.positions[:, j], 0))
+        out[~self.listed[:, j]] = np.nan
+        return out
@@ -1,5 +1,21 @@
 import queue
+import pandas as pd
 from my_utils import params_to_attr
+from event import (
+    MarketEvent,
+    SignalEvent,
+    OrderEvent,
+    FillEvent,
+    SignalBatchEvent,
+    OrderBatchEvent,
+    FillBatchEvent,
+    TargetWeightEvent,
+)
+from event_bus import EventBus
+from instrumentation import Instrumentation
+import checkpoint
+import os
+from results import ResultsWriter, EXTENSION, new_run_id
 
 
 class Backtest:
@@ -20,6 +36,15 @@ class Backtest:
         execution_handler_cls,
         portfolio_cls,
         stratergy_cls,
+        warmup=False,
+        event_bus_cls=EventBus,
+        stratergy_params=None,
+        instrument=False,
+        checkpoint_path=None,
+        checkpoint_every=None,
+        headless=False,
+        results_dir=None,
+        run_id=None,
     ):
         """
         Params:
@@ -79,29 +104,183 @@ class Backtest:
             
             stratergy_cls:
                 Type:
-                    Stratergy()
+                    Stratergy() or list of Stratergy()
                 Description:
                     looks at market data and generates trading signals    
-        """
+                    with a list every stratergy gets its own portfolio and execution
+                    handler and all of them share one pass over the data
 
-        self.events = queue.Queue()
-        self.events_priority_2 = queue.Queue()
+            warmup:
+                Type:
+                    Bool
+                Description:
+                    when True the bars needed to fill the stratergy's lookback are loaded
+                    from before start_date so it can trade from the first bar
 
-        self.signals = 0
-        self.orders = 0
-        self.fills = 0
-        self.num_strats = 1
+            event_bus_cls:
+                Type:
+                    EventBus()
+                Description:
+                    queue of events, one carries the data handler's market events and each
+                    stratergy gets its own for its signals, orders and fills
+                    must provide put(event, priority), get(False) raising queue.Empty and lane(priority)
+
+            stratergy_params:
+                Type:
+                    Dictionary or list of Dictionary
+                Description:
+                    keyword arguments passed to stratergy_cls, a list gives one
+                    stratergy per entry, a single class or dict is used for every entry
+                Example:
+                    {"ols_window": 50, "zscore_high": 2.0}
+                    [{"ols_window": 30}, {"ols_window": 60}]
+
+            instrument:
+                Type:
+                    Bool
+                Description:
+                    when True self.instrumentation times the event loop, see
+                    instrumentation.Instrumentation, when False nothing is wrapped
+
+            checkpoint_path:
+                Type:
+                    String
+                Description:
+                    file the engine state is written to, see checkpoint.py
+            
+            checkpoint_every:
+                Type:
+                    Int
+                Description:
+                    number of bars between checkpoints, None never writes one
+
+            headless:
+                Type:
+                    Bool
+                Description:
+                    when True simulate_trading never plots, so matplotlib is not
+                    imported and nothing blocks, for batch workers
+
+            results_dir:
+                Type:
+                    String
+                Description:
+                    when set each stratergy's equity, positions, trades and stats are
+                    appended to "<run_id>_<i>.btr" in this directory while the backtest
+                    runs (see results.py) and no equity.csv is written
+
+            run_id:
+                Type:
+                    String
+                Description:
+                    name of the run's results files, a random id when None so parallel
+                    runs never write the same file
+        """
+
+        self.events = self.event_bus_cls()
+        self.handlers = {MarketEvent: self._handle_market}
 
         self._generate_trading_instances()
 
+        self.results_writers = []
+        if self.results_dir is not None:
+            self._generate_results_writers()
+
+        self.instrumentation = None
+        if self.instrument:
+            self.instrumentation = Instrumentation(self)
+
+    def _stratergy_specs(self):
+        """
+            returns list of (stratergy class, params), one per stratergy to run
+        """
+        classes = self.stratergy_cls
+        if not isinstance(classes, (list, tuple)):
+            classes = [classes]
+        params = self.stratergy_params
+        if params is None:
+            params = {}
+        if not isinstance(params, (list, tuple)):
+            params = [params]
+
+        if len(classes) == 1:
+            classes = list(classes) * len(params)
+        if len(params) == 1:
+            params = list(params) * len(classes)
+        if len(classes) != len(params):
+            raise ValueError("stratergy_cls and stratergy_params lengths differ")
+        return list(zip(classes, params))
+
     def _generate_trading_instances(self):
         print("Creating DataHandler, Stratergy, Portfolio")
+        specs = self._stratergy_specs()
+        data_handler_params = {}
+        if self.warmup:
+            data_handler_params["warmup_bars"] = (
+                max(cls.required_lookback(**params) for cls, params in specs) - 1
+            )
         self.data_handler = self.data_handler_cls(
-            self.events, self.csv_dir, self.symbol_list, self.start_date, self.end_date
+            self.events,
+            self.csv_dir,
+            self.symbol_list,
+            self.start_date,
+            self.end_date,
+            **data_handler_params
         )
-        self.portfolio = self.portfolio_cls(self.data_handler, self.events)
-        self.stratergys = [self.stratergy_cls(self.data_handler, self.events)]
-        self.execution_handler = self.execution_handler_cls(self.events)
+
+        self.books = []
+        for cls, params in specs:
+            events = self.event_bus_cls()
+            portfolio = self.portfolio_cls(self.data_handler, events, self.inital_capital)
+            stratergy = cls(self.data_handler, events, **params)
+            execution_handler = self.execution_handler_cls(events)
+            self.books.append(
+                StratergyBook(stratergy, portfolio, execution_handler, events, params)
+            )
+
+        self.stratergys = [book.stratergy for book in self.books]
+        self.num_strats = len(self.books)
+        self.data_handler.set_lookback(max(s.lookback for s in self.stratergys))
+
+        # the first stratergy's components, as used by single stratergy backtests
+        self.portfolio = self.books[0].portfolio
+        self.execution_handler = self.books[0].execution_handler
+        self.events_priority_2 = self.books[0].events.lane(2)
+
+    def _generate_results_writers(self):
+        os.makedirs(self.results_dir, exist_ok=True)
+        if self.run_id is None:
+            self.run_id = new_run_id()
+        for i, book in enumerate(self.books):
+            name = "{}_{}".format(self.run_id, i)
+            meta = {
+                "run_id": name,
+                "stratergy": type(book.stratergy).__name__,
+                "params": book.params,
+                "inital_capital": self.inital_capital,
+                "start_date": self.start_date,
+                "end_date": self.end_date,
+            }
+            self.results_writers.append(
+                ResultsWriter(
+                    os.path.join(self.results_dir, name + EXTENSION),
+                    book,
+                    self.data_handler,
+                    meta=meta,
+                )
+            )
+
+    @property
+    def signals(self):
+        return sum(book.signals for book in self.books)
+
+    @property
+    def orders(self):
+        return sum(book.orders for book in self.books)
+
+    @property
+    def fills(self):
+        return sum(book.fills for book in self.books)
 
     def _run_backtest(self):
 
@@ -109,6 +288,9 @@ class Backtest:
             Runs the data generater and main event loop
         """
 
+        if self.instrumentation is not None:
+            self.instrumentation.start()
+
         count = 0
         while True:
             count += 1
@@ -119,71 +301,96 @@ class Backtest:
                 break
 
             self.handle_events()
-            self.handle_events_priority_2
-            self.handle_events()
+
+            for writer in self.results_writers:
+                writer.update()
+
+            if self.checkpoint_every and count % self.checkpoint_every == 0:
+                self.write_checkpoint()
+
+        if self.instrumentation is not None:
+            self.instrumentation.stop()
+
+        for writer, book in zip(self.results_writers, self.books):
+            stats = book.portfolio.metrics.stats()
+            stats.update({"signals": book.signals, "orders": book.orders, "fills": book.fills})
+            writer.close(stats)
+
+    def write_checkpoint(self, path=None):
+        """
+            writes the state of the backtest, only valid between bars
+        """
+        checkpoint.write_checkpoint(self, path or self.checkpoint_path)
+
+    def restore_checkpoint(self, path=None):
+        """
+            continues from a checkpoint written by a backtest built with the same
+            arguments, simulate_trading then runs the remaining bars. with results_dir
+            the results files of the checkpointed run are continued, so the checkpoint
+            must have been written with results_dir too
+        """
+        checkpoint.restore(self, checkpoint.read_checkpoint(path or self.checkpoint_path))
+
+    def register_handler(self, event_cls, handler):
+        """
+            handler(event) is called for every event of exactly event_cls put
+            on the backtest's own events, ie by the data handler
+        """
+        self.handlers[event_cls] = handler
 
     def handle_events(self):
-        # handle events in que
+        # handle events in every priority lane until they are all empty
+        events = self.events
+        handlers = self.handlers
         while True:
-
-            # get event from queue
             try:
-                event = self.events.get(False)
+                event = events.get(False)
             except queue.Empty:
                 break
             else:
-
                 if event is not None:
-                    # switch on event type
-                    if event.type == "MARKET":
-                        # Handle processing of new market data
-                        for s in self.stratergys:
-                            s.calculate_signal()
-                        self.portfolio.update()
-                    elif event.type == "SIGNAL":
-                        self.signals += 1
-                        self.portfolio.handle_signal(event)
-
-                    elif event.type == "ORDER":
-                        self.orders += 1
-                        self.execution_handler.execute_order(event)
-                    # print("signal : ", signal)
-                    elif event.type == "FILL":
-                        self.fills += 1
-                        self.portfolio.process_fill(event)
-
-    def handle_events_priority_2(self):
-        # handle events in priority 2 que
-        while True:
+                    handlers[type(event)](event)
 
-            # get event from queue
-            try:
-                event = self.events_priority_2.get(False)
-            except queue.Empty:
-                break
-            else:
+    def _handle_market(self, event):
+        # Handle processing of new market data by every stratergy in turn
+        for book in self.books:
+            book.handle_market(event)
 
-                if event is not None:
-                    if event.type == "SIGNAL":
-                        self.signals += 1
-                        self.portfolio.handle_signal(event)
-
-                    elif event.type == "ORDER":
-                        self.orders += 1
-                        self.execution_handler.execute_order(event)
-                    # print("signal : ", signal)
-                    elif event.type == "FILL":
-                        self.fills += 1
-                        self.portfolio.process_fill(event)
+    def results(self):
+        """
+            returns DataFrame of one row per stratergy, its params, event counts
+            and summary stats
+        """
+        rows = []
+        for book in self.books:
+            row = {"stratergy": type(book.stratergy).__name__}
+            row.update(book.params)
+            row.update(
+                {"signals": book.signals, "orders": book.orders, "fills": book.fills}
+            )
+            row.update(book.portfolio.summary_stats())
+            rows.append(row)
+        return pd.DataFrame(rows)
 
     def _output_performance(self):
+        if self.num_strats > 1:
+            print(self.results())
+            for i, book in enumerate(self.books):
+                if not self.results_writers:
+                    book.portfolio.output_summary_stats("equity_{}.csv".format(i))
+            return
+
         print("Signals : {}".format(self.signals))
         print("Orders : {}".format(self.orders))
         print("Fills : {}".format(self.fills))
+        if self.instrumentation is not None:
+            print("Bars/sec : {:.0f}".format(self.instrumentation.report()["bars_per_sec"]))
 
-        stats = self.portfolio.output_summary_stats()
+        equity_path = None if self.results_writers else "equity.csv"
+        stats = self.portfolio.output_summary_stats(equity_path)
         print(stats)
-        self.portfolio.display_results()
+        if not self.headless:
+            self.portfolio.display_results()
 
     def simulate_trading(self):
         """
@@ -191,3 +398,82 @@ class Backtest:
         """
         self._run_backtest()
         self._output_performance()
+
+
+class StratergyBook:
+    """
+        One stratergy with its own portfolio, execution handler and events
+
+        the signals, orders and fills of a stratergy never leave its book so many
+        books can share one data handler
+    """
+
+    def __init__(self, stratergy, portfolio, execution_handler, events, params=None):
+        self.stratergy = stratergy
+        self.portfolio = portfolio
+        self.execution_handler = execution_handler
+        self.events = events
+        self.params = {} if params is None else params
+
+        self.signals = 0
+        self.orders = 0
+        self.fills = 0
+        self.handlers = {
+            SignalEvent: self._handle_signal,
+            OrderEvent: self._handle_order,
+            FillEvent: self._handle_fill,
+            SignalBatchEvent: self._handle_signal_batch,
+            OrderBatchEvent: self._handle_order_batch,
+            FillBatchEvent: self._handle_fill_batch,
+            TargetWeightEvent: self._handle_target_weights,
+        }
+
+    def register_handler(self, event_cls, handler):
+        self.handlers[event_cls] = handler
+
+    def handle_market(self, event):
+        self.stratergy.calculate_signal()
+        self.portfolio.update()
+        self.handle_events()
+
+    def handle_events(self):
+        # handle events in every priority lane until they are all empty
+        events = self.events
+        handlers = self.handlers
+        while True:
+            try:
+                event = events.get(False)
+            except queue.Empty:
+                break
+            else:
+                if event is not None:
+                    handlers[type(event)](event)
+
+    def _handle_signal(self, event):
+        self.signals += 1
+        self.portfolio.handle_signal(event)
+
+    def _handle_order(self, event):
+        self.orders += 1
+        self.execution_handler.execute_order(event)
+
+    def _handle_fill(self, event):
+        self.fills += 1
+        self.portfolio.process_fill(event)
+
+    # batches count as the number of signals, orders or fills they carry
+    def _handle_signal_batch(self, event):
+        self.signals += len(event)
+        self.portfolio.handle_signal_batch(event)
+
+    def _handle_order_batch(self, event):
+        self.orders += len(event)
+        self.execution_handler.execute_order_batch(event)
+
+    def _handle_fill_batch(self, event):
+        self.fills += len(event)
+        self.portfolio.process_fill_batch(event)
+
+    def _handle_target_weights(self, event):
+        self.signals += len(event)
+        self.portfolio.handle_target_weights(event)
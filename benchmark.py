@@ -0,0 +1,227 @@
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from data import DataHandler
+from event import MarketEvent, SignalEvent, OrderEvent, FillEvent
+from event_bus import EventBus
+
+CSV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SYMBOL_LIST = ["SPY", "IJS", "EFA", "EEM", "AGG", "JNK", "DJP", "RWR"]
+
+
+def time_call(func, repeats=1):
+    """
+        returns the best wall clock time in seconds of calling func repeats times
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_csv_cache(csv_dir=CSV_DIR, symbol_list=SYMBOL_LIST, repeats=5):
+    """
+        compares DataHandler load time from the csv files, a cold cache (parse and
+        write) and a warm cache (memory mapped load)
+
+        the cache is built in a temporary folder so the cache next to csv_dir is
+        left alone
+
+        returns dict of seconds {"no_cache": , "cold": , "warm": }
+    """
+    cache_dir = tempfile.mkdtemp(prefix="bench_csv_cache_")
+
+    def load(use_cache):
+        DataHandler(
+            queue.Queue(), csv_dir, symbol_list, use_cache=use_cache, cache_dir=cache_dir
+        )
+
+    def cold():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        load(True)
+
+    try:
+        results = {
+            "no_cache": time_call(lambda: load(False), repeats),
+            "cold": time_call(cold, repeats),
+            "warm": time_call(lambda: load(True), repeats),
+        }
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+def bench_parallel_loading(
+    csv_dir=CSV_DIR,
+    symbol_list=SYMBOL_LIST,
+    worker_counts=(1, 2, 4, 8),
+    executor="process",
+    repeats=3,
+):
+    """
+        DataHandler load time for each worker count in worker_counts
+
+        returns dict of {workers: seconds}
+    """
+    results = {}
+    for workers in worker_counts:
+        results[workers] = time_call(
+            lambda: DataHandler(
+                queue.Queue(),
+                csv_dir,
+                symbol_list,
+                workers=workers,
+                executor=executor,
+            ),
+            repeats,
+        )
+    return results
+
+
+def _sample_events(n_events):
+    sample = [
+        MarketEvent(),
+        SignalEvent("SPY", None, "BUY", 1.0),
+        OrderEvent("SPY", 10, "BUY"),
+        FillEvent("SPY", 10, "BUY", None),
+    ]
+    return [sample[i % len(sample)] for i in range(n_events)]
+
+
+def bench_event_dispatch(n_events=1000000):
+    """
+        events per second put and dispatched by the old queue.Queue and event.type
+        if/elif loop and by an EventBus with a handler table, handlers do nothing
+
+        returns dict of {"queue": events_per_sec, "event_bus": events_per_sec}
+    """
+    events = _sample_events(n_events)
+    counts = {"MARKET": 0, "SIGNAL": 0, "ORDER": 0, "FILL": 0}
+
+    def queue_loop():
+        q = queue.Queue()
+        for event in events:
+            q.put(event)
+        while True:
+            try:
+                event = q.get(False)
+            except queue.Empty:
+                break
+            else:
+                if event.type == "MARKET":
+                    counts["MARKET"] += 1
+                elif event.type == "SIGNAL":
+                    counts["SIGNAL"] += 1
+                elif event.type == "ORDER":
+                    counts["ORDER"] += 1
+                elif event.type == "FILL":
+                    counts["FILL"] += 1
+
+    def bus_loop():
+        bus = EventBus()
+        handlers = {
+            MarketEvent: lambda e: None,
+            SignalEvent: lambda e: None,
+            OrderEvent: lambda e: None,
+            FillEvent: lambda e: None,
+        }
+        for event in events:
+            bus.put(event)
+        while True:
+            try:
+                event = bus.get(False)
+            except queue.Empty:
+                break
+            else:
+                handlers[type(event)](event)
+
+    return {
+        "queue": n_events / time_call(queue_loop),
+        "event_bus": n_events / time_call(bus_loop),
+    }
+
+
+# run in a fresh interpreter by bench_startup, prints the timings as json
+_STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from backtest import Backtest
+from data import DataHandler
+from execution import ExecutionHandler
+from portfolio import Portfolio
+from portfolioBalancingStrat import end_of_month_rebalance_stratergy
+from mrStrat import OLSMRStratergy
+imported = time.perf_counter()
+backtest = Backtest(
+    sys.argv[1], sys.argv[2].split(","), 100000, None, None, DataHandler,
+    ExecutionHandler, Portfolio, end_of_month_rebalance_stratergy, headless=True,
+)
+built = time.perf_counter()
+backtest.data_handler.update_bars()
+backtest.handle_events()
+first_bar = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "build": built - imported,
+    "first_bar": first_bar - built,
+    "total": first_bar - start,
+    "heavy_modules": sorted(
+        m for m in ("matplotlib", "statsmodels", "pandas_datareader") if m in sys.modules
+    ),
+}))
+"""
+
+
+def bench_startup(csv_dir=CSV_DIR, symbol_list=SYMBOL_LIST, repeats=5):
+    """
+        seconds from a fresh interpreter to the first bar being handled by a
+        headless Backtest, split into importing the modules, building the
+        Backtest and the first bar, best of repeats
+
+        returns dict {"import": , "build": , "first_bar": , "total": ,
+        "heavy_modules": plotting or fitting modules that were loaded}
+    """
+    best = None
+    for _ in range(repeats):
+        out = subprocess.run(
+            [sys.executable, "-c", _STARTUP_SCRIPT, csv_dir, ",".join(symbol_list)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        if best is None or result["total"] < best["total"]:
+            best = result
+    return best
+
+
+if __name__ == "__main__":
+
+    startup = bench_startup()
+    print(
+        "startup import {import:.3f}s build {build:.3f}s first bar {first_bar:.4f}s".format(
+            **startup
+        )
+    )
+    print("heavy modules loaded at startup: {}".format(startup["heavy_modules"]))
+
+    for name, seconds in bench_csv_cache().items():
+        print("csv load {:<10}: {:.4f}s".format(name, seconds))
+
+    for executor in ("process", "thread"):
+        for workers, seconds in bench_parallel_loading(executor=executor).items():
+            print("{} pool {} workers: {:.4f}s".format(executor, workers, seconds))
+
+    for name, rate in bench_event_dispatch().items():
+        print("{:<10} {:,.0f} events/sec".format(name, rate))
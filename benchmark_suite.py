@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from backtest import Backtest
+from data import DataHandler
+from event_bus import EventBus
+from execution import ExecutionHandler
+from mrStrat import OLSMRStratergy
+from portfolio import Portfolio
+from portfolioBalancingStrat import end_of_month_rebalance_stratergy
+from stratergy import SimpleStratergy
+
+# columns in the order of the yahoo finance files in data/
+CSV_COLUMNS = ["Date", "High", "Low", "Open", "Close", "Volume", "Adj Close"]
+
+STRATERGYS = {
+    "simple": SimpleStratergy,
+    "ols_mr": OLSMRStratergy,
+    "monthly_rebalance": end_of_month_rebalance_stratergy,
+}
+
+
+def generate_synthetic_data(
+    out_dir, n_symbols, n_bars, gap_fraction=0.0, freq="B", start="2000-01-03", seed=0
+):
+    """
+        writes n_symbols csv files "SYM0000.csv" ... in the same layout as data/
+        with geometric random walk prices
+
+        Params:
+            out_dir:
+                directory the files are written to, created if missing
+            n_bars:
+                number of datetimes in the calendar, every symbol has a row on each
+                of them except its gaps
+            gap_fraction:
+                fraction of each symbol's rows dropped at random, the data handler
+                pads these forward
+            freq:
+                pandas frequency of the calendar, "B" daily, "min" minutely
+
+        returns the symbol list
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=n_bars, freq=freq)
+    symbol_list = ["SYM{:04d}".format(j) for j in range(n_symbols)]
+
+    for symbol in symbol_list:
+        close = 100.0 * np.exp(np.cumsum(rng.normal(0.0002, 0.01, n_bars)))
+        spread = np.abs(rng.normal(0.0, 0.005, n_bars)) * close
+        columns = [
+            close + spread,
+            close - spread,
+            close + rng.uniform(-1.0, 1.0, n_bars) * spread,
+            close,
+            rng.integers(1e5, 1e7, n_bars).astype(np.float64),
+            close,
+        ]
+        frame = pd.DataFrame(
+            dict(zip(CSV_COLUMNS[1:], columns)),
+            index=pd.Index(dates, name=CSV_COLUMNS[0]),
+        )
+        if gap_fraction > 0:
+            keep = rng.random(n_bars) >= gap_fraction
+            keep[0] = True
+            frame = frame[keep]
+        frame.to_csv(os.path.join(out_dir, "{}.csv".format(symbol)))
+    return symbol_list
+
+
+def measure(func, trace_memory=True):
+    """
+        runs func once untraced for its time, then again under tracemalloc for its
+        peak python and numpy allocation
+
+        returns (result of the timed call, {"seconds": , "peak_bytes": })
+    """
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, {"seconds": seconds, "peak_bytes": peak}
+
+
+def run_suite(
+    n_symbols=10,
+    n_bars=1000,
+    gap_fraction=0.0,
+    freq="B",
+    stratergys=tuple(STRATERGYS),
+    data_dir=None,
+    trace_memory=True,
+):
+    """
+        generates synthetic data and times each stage of the pipeline on it
+
+        stages
+            generate:                      writing the synthetic csv files
+            load:                          DataHandler loading and aligning them
+            backtest[<name>]:              Backtest event loop of each stratergy in
+                                           STRATERGYS, headless
+            summary_stats[<name>]:         Portfolio.output_summary_stats of that run
+
+        data_dir:
+            where the files are written, a temporary directory removed afterwards
+            when None
+
+        returns dict {"config": {...}, "stages": {stage: {"seconds": , "peak_bytes": }}}
+    """
+    config = {
+        "n_symbols": n_symbols,
+        "n_bars": n_bars,
+        "gap_fraction": gap_fraction,
+        "freq": freq,
+        "stratergys": list(stratergys),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+    stages = {}
+    remove = data_dir is None
+    if remove:
+        data_dir = tempfile.mkdtemp(prefix="synthetic_bars_")
+
+    try:
+        start = time.perf_counter()
+        symbol_list = generate_synthetic_data(
+            data_dir, n_symbols, n_bars, gap_fraction, freq
+        )
+        stages["generate"] = {"seconds": time.perf_counter() - start, "peak_bytes": None}
+
+        _, stages["load"] = measure(
+            lambda: DataHandler(EventBus(), data_dir, symbol_list), trace_memory
+        )
+
+        for name in stratergys:
+
+            def run_backtest():
+                backtest = Backtest(
+                    data_dir,
+                    symbol_list,
+                    100000,
+                    None,
+                    None,
+                    DataHandler,
+                    ExecutionHandler,
+                    Portfolio,
+                    STRATERGYS[name],
+                    headless=True,
+                )
+                backtest._run_backtest()
+                return backtest
+
+            backtest, stages["backtest[{}]".format(name)] = measure(
+                run_backtest, trace_memory
+            )
+            _, stages["summary_stats[{}]".format(name)] = measure(
+                lambda: backtest.portfolio.output_summary_stats(equity_path=None),
+                trace_memory,
+            )
+    finally:
+        if remove:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    return {"config": config, "stages": stages}
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+        the stages of results that are more than tolerance (a fraction) slower or
+        larger in peak memory than the same stage of baseline
+
+        returns list of dicts {"stage": , "metric": , "baseline": , "result": , "ratio": }
+    """
+    regressions = []
+    for stage, measured in results["stages"].items():
+        expected = baseline["stages"].get(stage)
+        if expected is None:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            if not measured.get(metric) or not expected.get(metric):
+                continue
+            ratio = measured[metric] / expected[metric]
+            if ratio > 1.0 + tolerance:
+                regressions.append(
+                    {
+                        "stage": stage,
+                        "metric": metric,
+                        "baseline": expected[metric],
+                        "result": measured[metric],
+                        "ratio": ratio,
+                    }
+                )
+    return regressions
+
+
+def _print_results(results):
+    for stage, measured in results["stages"].items():
+        peak = measured["peak_bytes"]
+        print(
+            "{:<32} {:>10.4f}s {:>12}".format(
+                stage,
+                measured["seconds"],
+                "" if peak is None else "{:.1f}MB".format(peak / 1e6),
+            )
+        )
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="synthetic data pipeline benchmark")
+    parser.add_argument("--symbols", type=int, default=10)
+    parser.add_argument("--bars", type=int, default=1000)
+    parser.add_argument("--gaps", type=float, default=0.0, help="fraction of rows dropped")
+    parser.add_argument("--freq", default="B")
+    parser.add_argument("--stratergys", nargs="+", default=list(STRATERGYS))
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced runs")
+    parser.add_argument("--output", default=None, help="write the results json here")
+    parser.add_argument("--baseline", default=None, help="results json to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run_suite(
+        args.symbols,
+        args.bars,
+        args.gaps,
+        args.freq,
+        args.stratergys,
+        args.data_dir,
+        not args.no_memory,
+    )
+    _print_results(results)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for r in regressions:
+            print(
+                "REGRESSION {stage} {metric}: {baseline:.4g} -> {result:.4g} "
+                "({ratio:.2f}x)".format(**r)
+            )
+        if regressions:
+            sys.exit(1)
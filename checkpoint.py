@@ -0,0 +1,117 @@
+import os
+import pickle
+import types
+import zlib
+
+from event_bus import EventBus, EventLane
+
+CHECKPOINT_VERSION = 1
+
+
+def _is_shared(value, data_handler):
+    """
+        True for the references a component holds to things the backtest rebuilds
+        itself: the data handler, event buses and bound or wrapped functions
+    """
+    return (
+        value is data_handler
+        or isinstance(value, (EventBus, EventLane))
+        or isinstance(value, (types.FunctionType, types.MethodType))
+    )
+
+
+def component_state(obj, data_handler):
+    """
+        the attributes of a stratergy, portfolio or execution handler that make up
+        its state
+    """
+    return {
+        key: value
+        for key, value in vars(obj).items()
+        if not _is_shared(value, data_handler)
+    }
+
+
+def snapshot(backtest):
+    """
+        returns the state of a backtest between two bars as a dict
+    """
+    data_handler = backtest.data_handler
+    books = []
+    for book in backtest.books:
+        if not book.events.empty():
+            raise ValueError("can only checkpoint between bars, events are pending")
+        books.append(
+            {
+                "stratergy": component_state(book.stratergy, data_handler),
+                "portfolio": component_state(book.portfolio, data_handler),
+                "execution_handler": component_state(
+                    book.execution_handler, data_handler
+                ),
+                "counts": (book.signals, book.orders, book.fills),
+            }
+        )
+    return {
+        "version": CHECKPOINT_VERSION,
+        "symbol_list": list(backtest.symbol_list),
+        "start_date": backtest.start_date,
+        "end_date": backtest.end_date,
+        "stratergys": [type(book.stratergy).__name__ for book in backtest.books],
+        "data_handler": data_handler.get_state(),
+        "books": books,
+        "run_id": backtest.run_id,
+        "results": [writer.get_state() for writer in backtest.results_writers],
+    }
+
+
+def write_checkpoint(backtest, path):
+    """
+        writes a compressed binary snapshot of the backtest to path, the previous
+        checkpoint is only replaced once the new one is complete
+    """
+    data = zlib.compress(pickle.dumps(snapshot(backtest), pickle.HIGHEST_PROTOCOL))
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+def read_checkpoint(path):
+    with open(path, "rb") as f:
+        return pickle.loads(zlib.decompress(f.read()))
+
+
+def restore(backtest, state):
+    """
+        puts a backtest built with the same arguments back into the snapshot state
+    """
+    if state["version"] != CHECKPOINT_VERSION:
+        raise ValueError("unsupported checkpoint version {}".format(state["version"]))
+    expected = {
+        "symbol_list": list(backtest.symbol_list),
+        "start_date": backtest.start_date,
+        "end_date": backtest.end_date,
+        "stratergys": [type(book.stratergy).__name__ for book in backtest.books],
+    }
+    for key, value in expected.items():
+        if state[key] != value:
+            raise ValueError(
+                "checkpoint {} is {!r}, backtest has {!r}".format(key, state[key], value)
+            )
+
+    backtest.data_handler.set_state(state["data_handler"])
+    for book, book_state in zip(backtest.books, state["books"]):
+        vars(book.stratergy).update(book_state["stratergy"])
+        vars(book.portfolio).update(book_state["portfolio"])
+        vars(book.execution_handler).update(book_state["execution_handler"])
+        book.signals, book.orders, book.fills = book_state["counts"]
+
+    # results files continue where the checkpointed run left them
+    if backtest.results_writers:
+        results = state.get("results") or []
+        if len(results) != len(backtest.results_writers):
+            raise ValueError(
+                "checkpoint has no results files to continue, its trades were not recorded"
+            )
+        backtest.run_id = state.get("run_id")
+        for writer, writer_state in zip(backtest.results_writers, results):
+            writer.set_state(writer_state)
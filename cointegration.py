@@ -1,15 +1,12 @@
 import datetime
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 import pandas as pd
-import pandas_datareader.data as web
-import statsmodels.tsa.stattools as ts
-
-import statsmodels.formula.api as sm
 
 
 def plot_price_series(df, ts1, ts2):
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
     months = mdates.MonthLocator()
     fig, ax = plt.subplots()
     ax.plot(df.index, df[ts1], label=ts1)
@@ -28,6 +25,8 @@ def plot_price_series(df, ts1, ts2):
 
 
 def plot_scatter_series(df, ts1, ts2):
+    import matplotlib.pyplot as plt
+
     plt.xlabel("{} Price ($)".format(ts1))
     plt.ylabel("{} Price ($)".format(ts2))
     plt.title("{} and {} Price Scatterplot".format(ts1, ts2))
@@ -36,6 +35,9 @@ def plot_scatter_series(df, ts1, ts2):
 
 
 def plot_residuals(df):
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
     months = mdates.MonthLocator()
     fig, ax = plt.subplots()
     ax.plot(df.index, df["res"], label="Residuals")
@@ -55,6 +57,10 @@ def plot_residuals(df):
 
 
 if __name__ == "__main__":
+    import pandas_datareader.data as web
+    import statsmodels.tsa.stattools as ts
+    import statsmodels.formula.api as sm
+
     start = datetime.datetime(2010, 1, 1)
     end = datetime.datetime(2015, 1, 1)
 
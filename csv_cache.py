@@ -0,0 +1,272 @@
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+BAR_FIELDS = ("open", "high", "low", "close", "volume", "adj_close")
+CACHE_DIR_NAME = ".cache"
+
+
+def read_symbol_csv(csv_path):
+    """
+        Parses a yahoo finance csv file into a dataframe indexed by datetime
+        with the columns of BAR_FIELDS
+    """
+    return pd.read_csv(
+        csv_path,
+        header=0,
+        index_col=0,
+        parse_dates=True,
+        names=["datetime"] + list(BAR_FIELDS),
+    )
+
+
+class CsvCache:
+    """
+        Binary columnar cache of parsed csv price files
+
+        each csv file "dir/SPY.csv" is cached in the folder "dir/.cache/SPY/" as
+            datetime.npy    datetime64[ns] index
+            <field>.npy     one float64 array per field in BAR_FIELDS
+            meta.json       source path, size and mtime of the csv it was built from
+
+        and, when a date range is read with read_range, a row index of the csv
+            row_datetime.npy    datetime of each data row as int64 ns
+            row_offset.npy      byte offset of the start of each data row
+            row_meta.json       same key as meta.json
+
+        meta.json is written last so a half written entry is never treated as valid.
+        an entry is rebuilt whenever the source csv size or mtime changes.
+        cached arrays are loaded with memory mapping so they are only paged in when read.
+        every file is written under a temporary name and moved into place, so a
+        process still mapping the old file keeps reading it rather than a truncated one.
+    """
+
+    def __init__(self, cache_dir=None):
+        """
+            Params:
+                cache_dir:
+                    Type:
+                        String
+                    Description:
+                        folder to keep the cache in, defaults to ".cache" next to each csv
+        """
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def entry_dir(self, csv_path):
+        csv_dir, file_name = os.path.split(os.path.abspath(csv_path))
+        cache_dir = self.cache_dir
+        if cache_dir is None:
+            cache_dir = os.path.join(csv_dir, CACHE_DIR_NAME)
+        return os.path.join(cache_dir, os.path.splitext(file_name)[0])
+
+    def _source_key(self, csv_path):
+        stat = os.stat(csv_path)
+        return {
+            "source": os.path.abspath(csv_path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+
+    def is_valid(self, csv_path, meta_name="meta.json"):
+        meta_path = os.path.join(self.entry_dir(csv_path), meta_name)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        key = self._source_key(csv_path)
+        return all(meta.get(k) == v for k, v in key.items()) and tuple(
+            meta.get("fields", ())
+        ) == tuple(BAR_FIELDS)
+
+    def build(self, csv_path):
+        """
+            parses the csv and writes its cache entry, returns the parsed dataframe
+        """
+        frame = read_symbol_csv(csv_path)
+        entry_dir = self.entry_dir(csv_path)
+        os.makedirs(entry_dir, exist_ok=True)
+
+        meta_path = os.path.join(entry_dir, "meta.json")
+        _remove(meta_path)
+
+        _replace_array(
+            os.path.join(entry_dir, "datetime.npy"),
+            frame.index.values.astype("datetime64[ns]"),
+        )
+        for key in BAR_FIELDS:
+            _replace_array(
+                os.path.join(entry_dir, "{}.npy".format(key)),
+                frame[key].to_numpy(dtype=np.float64),
+            )
+
+        meta = self._source_key(csv_path)
+        meta["fields"] = list(BAR_FIELDS)
+        _replace_json(meta_path, meta)
+        return frame
+
+    def load_arrays(self, csv_path):
+        """
+            returns (datetime index array, {field: array}) memory mapped from the cache
+        """
+        entry_dir = self.entry_dir(csv_path)
+        index = np.load(os.path.join(entry_dir, "datetime.npy"), mmap_mode="r")
+        columns = {
+            key: np.load(os.path.join(entry_dir, "{}.npy".format(key)), mmap_mode="r")
+            for key in BAR_FIELDS
+        }
+        return index, columns
+
+    def load(self, csv_path):
+        """
+            returns the dataframe for csv_path, from the cache when it is up to date
+            otherwise parses the csv and rebuilds the cache entry
+        """
+        if self.is_valid(csv_path):
+            self.hits += 1
+            index, columns = self.load_arrays(csv_path)
+            return pd.DataFrame(
+                columns, index=pd.DatetimeIndex(index, name="datetime"), copy=False
+            )
+
+        self.misses += 1
+        return self.build(csv_path)
+
+    def build_row_index(self, csv_path):
+        """
+            scans the csv once and writes the datetime and byte offset of every row
+            returns (datetimes as int64 ns, offsets)
+        """
+        dates = []
+        offsets = []
+        with open(csv_path, "rb") as f:
+            offset = len(f.readline())
+            for line in f:
+                if line.strip():
+                    dates.append(line.split(b",", 1)[0].decode())
+                    offsets.append(offset)
+                offset += len(line)
+        times = pd.to_datetime(dates).values.astype("datetime64[ns]").view("i8")
+        offsets = np.array(offsets, dtype=np.int64)
+
+        entry_dir = self.entry_dir(csv_path)
+        os.makedirs(entry_dir, exist_ok=True)
+        meta_path = os.path.join(entry_dir, "row_meta.json")
+        _remove(meta_path)
+        _replace_array(os.path.join(entry_dir, "row_datetime.npy"), times)
+        _replace_array(os.path.join(entry_dir, "row_offset.npy"), offsets)
+        meta = self._source_key(csv_path)
+        meta["fields"] = list(BAR_FIELDS)
+        _replace_json(meta_path, meta)
+        return times, offsets
+
+    def row_index(self, csv_path):
+        """
+            returns (datetimes as int64 ns, byte offsets) of the rows of csv_path
+            rebuilding the index when the csv has changed
+        """
+        if not self.is_valid(csv_path, "row_meta.json"):
+            return self.build_row_index(csv_path)
+        entry_dir = self.entry_dir(csv_path)
+        return (
+            np.load(os.path.join(entry_dir, "row_datetime.npy"), mmap_mode="r"),
+            np.load(os.path.join(entry_dir, "row_offset.npy"), mmap_mode="r"),
+        )
+
+    def read_range(self, csv_path, start_date=None, end_date=None, warmup_bars=0):
+        """
+            parses only the rows of csv_path between start_date and end_date plus
+            warmup_bars rows before start_date, using the row index to read just
+            that byte range of the file
+
+            csv files that are not sorted by datetime are parsed in full and left
+            for the caller to cut
+        """
+        times, offsets = self.row_index(csv_path)
+        if np.any(times[1:] < times[:-1]):
+            return read_symbol_csv(csv_path)
+
+        first, last = _range_rows(times, start_date, end_date, warmup_bars)
+        with open(csv_path, "rb") as f:
+            header = f.readline()
+            body = b""
+            if first < last:
+                f.seek(offsets[first])
+                if last < len(offsets):
+                    body = f.read(offsets[last] - offsets[first])
+                else:
+                    body = f.read()
+        return read_symbol_csv(io.BytesIO(header + body))
+
+    def load_range(self, csv_path, start_date=None, end_date=None, warmup_bars=0):
+        """
+            as read_range but sliced from the binary cache entry, which is built
+            first when missing or out of date, only the rows in range are paged in
+        """
+        if not self.is_valid(csv_path):
+            self.misses += 1
+            self.build(csv_path)
+        else:
+            self.hits += 1
+        index, columns = self.load_arrays(csv_path)
+        times = index.view("i8")
+        if np.any(times[1:] < times[:-1]):
+            return pd.DataFrame(
+                columns, index=pd.DatetimeIndex(index, name="datetime"), copy=False
+            )
+
+        first, last = _range_rows(times, start_date, end_date, warmup_bars)
+        return pd.DataFrame(
+            {key: values[first:last] for key, values in columns.items()},
+            index=pd.DatetimeIndex(index[first:last], name="datetime"),
+            copy=False,
+        )
+
+
+def _temp_path(path):
+    # unique per process so two processes rebuilding one entry never share a file
+    return "{}.{}.tmp".format(path, os.getpid())
+
+
+def _replace_array(path, array):
+    """
+        writes array as a .npy file to path, the old file is replaced in one step
+    """
+    tmp = _temp_path(path)
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _replace_json(path, obj):
+    tmp = _temp_path(path)
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _range_rows(times, start_date, end_date, warmup_bars):
+    """
+        (first, last) rows of sorted int64 ns times between start_date and end_date,
+        first moved back by warmup_bars rows
+    """
+    first = 0
+    last = len(times)
+    if start_date is not None:
+        first = np.searchsorted(times, pd.Timestamp(start_date).value)
+        first = max(first - warmup_bars, 0)
+    if end_date is not None:
+        last = np.searchsorted(times, pd.Timestamp(end_date).value, side="right")
+    return first, max(first, last)
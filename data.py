@@ -4,30 +4,99 @@ import os
 
 from my_utils import params_to_attr
 from event import MarketEvent
+from csv_cache import BAR_FIELDS, CsvCache, read_symbol_csv
+from alignment import Alignment
 from math import isnan
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def normalise_symbol_frame(frame):
+    """
+        sorts a symbol frame by datetime, keeps the last row of any repeated datetime
+        and makes every field float64
+    """
+    if not frame.index.is_monotonic_increasing:
+        frame = frame.sort_index(kind="stable")
+    if frame.index.has_duplicates:
+        frame = frame[~frame.index.duplicated(keep="last")]
+    return frame.astype(np.float64, copy=False)
+
+
+def load_symbol_frame(csv_path, use_cache=False, date_range=None, cache_dir=None):
+    """
+        parses and normalises one symbol file, module level so it can run in a process pool
+
+        date_range:
+            optional (start_date, end_date, warmup_bars), only that range of the csv
+            is read and parsed (see CsvCache.read_range), or sliced from the binary
+            cache when use_cache is also set (see CsvCache.load_range)
+        cache_dir:
+            folder of the csv cache, None keeps it next to the csv files
+    """
+    cache = CsvCache(cache_dir)
+    if use_cache and date_range is not None:
+        frame = cache.load_range(csv_path, *date_range)
+    elif use_cache:
+        frame = cache.load(csv_path)
+    elif date_range is not None:
+        frame = cache.read_range(csv_path, *date_range)
+    else:
+        frame = read_symbol_csv(csv_path)
+    return normalise_symbol_frame(frame)
 
 
 class DataHandler:
     """
-        Holds the data frame of the current and future bar info
-        
+        Holds the data of the current and future bar info in a columnar store
+
         Data:
+            bar_index:
+                Type:
+                    DatetimeIndex
+                Description:
+                    datetimes shared by every symbol, one entry per bar
             symbol_data:
-                Type: 
-                    Dictionary of iterator of tuple
+                Type:
+                    Dictionary of dictionary of numpy float64 arrays
                 Description:
-                    key is symbol itterator is of datetime and row which is bar info    
+                    key is symbol, inner key is the bar field, each array is
+                    len(bar_index) long and preallocated at load time
                 Example:
-                    {"symbol": iterator(datetime, row)}
-            row aka bar:
+                    {"symbol": {"open": array([...]), ..., "adj_close": array([...])}}
+            listed:
+                Type:
+                    Dictionary of numpy bool arrays
+                Description:
+                    key is symbol, True for each bar at or after the symbol's first bar
+            bar_cursor:
                 Type:
-                    DataFrame
+                    Int
+                Description:
+                    number of bars released to the system so far,
+                    the latest bar is at position bar_cursor - 1
+            row aka bar:
                 row_keys:
                     "open", "high", "low", "close", "volume", "adj_close"
     """
 
+    lookback = None
+
     @params_to_attr
-    def __init__(self, events, csv_dir, symbol_list, start_date=None, end_date=None):
+    def __init__(
+        self,
+        events,
+        csv_dir,
+        symbol_list,
+        start_date=None,
+        end_date=None,
+        use_cache=False,
+        workers=None,
+        executor="process",
+        range_pushdown=False,
+        warmup_bars=0,
+        cache_dir=None,
+    ):
         """
             Params:
                 events:
@@ -39,110 +108,171 @@ class DataHandler:
                     list of ticker/symbol names of the csv files required from the folder
                     ["APPL", "GOOG"]
                     the csv files are assumed to be of form "symbol.csv"
+                use_cache:
+                    when True parsed csv files are kept in a binary cache next to the
+                    csv files (see csv_cache.CsvCache) and reused while the csv is unchanged
+                workers:
+                    number of symbol files parsed concurrently, None or 1 loads serially
+                executor:
+                    "process" or "thread", the kind of pool used when workers > 1
+                range_pushdown:
+                    when True only the rows between start_date and end_date (plus the
+                    warmup bars) are read from each csv, located with a row index kept
+                    in the csv cache folder, with use_cache the range is sliced from
+                    the binary cache instead
+                warmup_bars:
+                    number of bars before start_date loaded as history, the first bar
+                    released by update_bars is still the one at start_date
+                cache_dir:
+                    folder the csv cache and row indexes are kept in, None uses
+                    ".cache" next to the csv files
         """
         self.symbol_data = {}
-        self.latest_symbol_data = {}
+        self.bar_cursor = 0
         self.open_convert_csv_files(symbol_list, csv_dir, start_date, end_date)
         self.finished = False
 
     def open_convert_csv_files(self, symbol_list, csv_dir, start_date, end_date):
         """
-            Opens the csv files and combines them into a dataframe self.symbol_data[s]
+            Opens the csv files and combines them into the columnar store self.symbol_data[s]
             csv files are assumed to be from yahoo finance
 
             combines index datetimes of all files so they are same length
-            pads forward any missing values for all symbols
-
-            self.symbol_data dictionary of iterator with key being symbol
-            {"symbol": iterator(datetime, row)}
-        """
-        comb_index = None
-        for s in symbol_list:
-            self.symbol_data[s] = pd.read_csv(
-                os.path.join(csv_dir, "{}.csv".format(s)),
-                header=0,
-                index_col=0,
-                parse_dates=True,
-                names=[
-                    "datetime",
-                    "open",
-                    "high",
-                    "low",
-                    "close",
-                    "volume",
-                    "adj_close",
-                ],
-            )
-
-            # Combine indexs to match pad values forward if missing
-            if comb_index is None:
-                comb_index = self.symbol_data[s].index
-            else:
-                comb_index.union(self.symbol_data[s].index)
-
-            # create start entry in latest_symbol_data
-            self.latest_symbol_data[s] = []
-
-        # reIndex and turn into iterator
-        for s in symbol_list:
-            self.symbol_data[s] = self.symbol_data[s].reindex(
-                index=comb_index, method="pad"
-            )
-            if start_date is not None:
-                self.symbol_data[s] = self.symbol_data[s].loc[start_date:]
-            else:
-                self.start_date = self.symbol_data[s].index[0]
-            if end_date is not None:
-                self.symbol_data[s] = self.symbol_data[s].loc[:end_date]
+            pads forward any missing values for all symbols, values before a
+            symbol's first bar are nan and self.listed[s] is False there
 
-            self.symbol_data[s] = self.symbol_data[s].iterrows()
+            self.symbol_data dictionary of field arrays with key being symbol
+            {"symbol": {"adj_close": array([...]), ...}}
+        """
+        frames = self._read_symbols(symbol_list, csv_dir)
 
-    def _get_new_bar(self, symbol):
-        # b is of form
-        # (index, row)
-        # row is a dict i belive with keys of column names
-        for b in self.symbol_data[symbol]:
-            yield b
+        # union of every symbol's datetimes, padded forward per symbol
+        self.alignment = Alignment(
+            [frames[s].index for s in symbol_list],
+            start_date,
+            end_date,
+            self.warmup_bars,
+        )
+        self.bar_index = pd.DatetimeIndex(self.alignment.calendar, name="datetime")
+        self.bar_cursor = self.alignment.warmup_bars
+        if start_date is None:
+            self.start_date = self.bar_index[self.bar_cursor]
 
-    def update_bars(self):
-        for s in self.symbol_list:
-            try:
-                bar = next(self._get_new_bar(s))
-                # bar is of form
-                # (index, row)
-                # row is a dict i belive with keys of column names
-            except StopIteration:
-                print("finished backtest")
-                self.finished = True
+        self.listed = {}
+        for j, s in enumerate(symbol_list):
+            self.symbol_data[s] = {
+                key: self.alignment.align(j, frames[s][key].to_numpy())
+                for key in BAR_FIELDS
+            }
+            self.listed[s] = self.alignment.listed[:, j]
+
+        self._datetimes = list(self.bar_index)
+        self.num_bars = len(self._datetimes)
+
+    def _read_symbols(self, symbol_list, csv_dir):
+        """
+            returns {symbol: normalised frame}, loaded on a pool when self.workers > 1
+            results are always assembled in symbol_list order
+        """
+        paths = [os.path.join(csv_dir, "{}.csv".format(s)) for s in symbol_list]
+        date_range = None
+        if self.range_pushdown:
+            # one row more than the warmup so every symbol has a row to pad forward from
+            date_range = (self.start_date, self.end_date, self.warmup_bars + 1)
+        load = partial(
+            load_symbol_frame,
+            use_cache=self.use_cache,
+            date_range=date_range,
+            cache_dir=self.cache_dir,
+        )
+
+        if self.workers is None or self.workers <= 1:
+            loaded = [load(path) for path in paths]
+        else:
+            if self.executor == "thread":
+                pool_cls = ThreadPoolExecutor
+            elif self.executor == "process":
+                pool_cls = ProcessPoolExecutor
             else:
-                if bar is not None:
-                    self.latest_symbol_data[s].append(bar)
+                raise ValueError("executor must be 'process' or 'thread'")
+            with pool_cls(max_workers=self.workers) as pool:
+                loaded = list(pool.map(load, paths))
+        return dict(zip(symbol_list, loaded))
+
+    def set_lookback(self, lookback):
+        """
+            called by the backtest with the largest lookback declared by its stratergys
+            every bar is already held in memory here so it is only recorded
+        """
+        self.lookback = lookback
+
+    def get_state(self):
+        """
+            the position of the data handler, used by checkpoint
+        """
+        return {"bar_cursor": self.bar_cursor, "finished": self.finished}
 
-        self.events.put(MarketEvent())
+    def set_state(self, state):
+        self.bar_cursor = state["bar_cursor"]
+        self.finished = state["finished"]
+
+    def update_bars(self):
+        if self.bar_cursor >= self.num_bars:
+            print("finished backtest")
+            self.finished = True
+        else:
+            self.bar_cursor += 1
+            self.events.put(MarketEvent())
 
     def get_latest_bar(self, symbol):
-        return self.latest_symbol_data[symbol][-1]
+        """
+            returns (datetime, row) of the latest bar, row is a Series keyed by field
+            only used where a whole bar is needed, prefer get_latest_bar_value
+        """
+        return self._get_bar(symbol, self.bar_cursor - 1)
 
     def get_latest_bars(self, symbol, N=1):
+        start = max(self.bar_cursor - N, 0)
+        return [self._get_bar(symbol, i) for i in range(start, self.bar_cursor)]
 
-        return self.latest_symbol_data[symbol][-N:]
+    def _get_bar(self, symbol, i):
+        columns = self.symbol_data[symbol]
+        row = pd.Series({key: columns[key][i] for key in BAR_FIELDS})
+        return (self._datetimes[i], row)
 
     def get_bar_values(self, symbol, key, N):
+        """
+            returns a read only view of the last N values of key, None if there
+            are not yet N bars
+        """
         bars = None
-        if N <= len(self.latest_symbol_data[symbol]):
-            bars = np.array(
-                [getattr(b[1], key) for b in self.get_latest_bars(symbol, N)]
-            )
+        if N <= self.bar_cursor:
+            bars = self.symbol_data[symbol][key][self.bar_cursor - N : self.bar_cursor]
+            bars.flags.writeable = False
         return bars
 
     def get_latest_bar_value(self, symbol, key):
-        val = getattr(self.get_latest_bar(symbol)[1], key)
+        val = self.symbol_data[symbol][key][self.bar_cursor - 1]
         if isnan(val):
             val = 0
         return val
 
+    def get_latest_bar_values(self, symbols, key):
+        """
+            returns numpy array of the latest value of key for each symbol, nan as 0
+        """
+        return np.array(
+            [self.get_latest_bar_value(s, key) for s in symbols], dtype=np.float64
+        )
+
     def get_latest_bar_datetime(self, symbol):
-        return self.latest_symbol_data[symbol][-1][0]
+        return self._datetimes[self.bar_cursor - 1]
+
+    def is_listed(self, symbol):
+        """
+            True if the symbol had started trading by the latest bar
+        """
+        return bool(self.listed[symbol][self.bar_cursor - 1])
 
 
 # if __name__ == "__main__":
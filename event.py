@@ -78,4 +78,113 @@ class FillEvent(Event):
         self.type = "FILL"
 
 
+class SignalBatchEvent(Event):
+    """
+        generated by stratergy
+        handled by portfolio
+
+        every signal of one bar as arrays, the i-th signal is
+        (symbols[i], signal_types[i], strengths[i])
+    """
+
+    @params_to_attr
+    def __init__(self, symbols, datetime, signal_types, strengths):
+        """
+            Params:
+                symbols:
+                    numpy array of symbols ["GOOG", "APPL"]
+                datetime:
+                    timestamp of when the signals were generated
+                signal_types:
+                    numpy array of "BUY", "SELL" or "EXIT"
+                strengths:
+                    numpy float array, as SignalEvent.strength
+        """
+        self.type = "SIGNAL_BATCH"
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+class TargetWeightEvent(Event):
+    """
+        generated by stratergy
+        handled by portfolio
+
+        the fraction of total holdings each symbol should be held at, the portfolio
+        trades only the difference from what it already holds
+    """
+
+    @params_to_attr
+    def __init__(self, symbols, datetime, weights):
+        """
+            Params:
+                symbols:
+                    numpy array of symbols ["GOOG", "APPL"]
+                datetime:
+                    timestamp of when the weights were generated
+                weights:
+                    numpy float array of target ratios, 0 closes the position,
+                    symbols not given are left as they are
+        """
+        self.type = "TARGET_WEIGHT"
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+class OrderBatchEvent(Event):
+    """
+        Generated by portfolio
+        handled by execution
+
+        models many market orders placed together, in the order they should be filled
+    """
+
+    @params_to_attr
+    def __init__(self, symbols, quantities, directions):
+        """
+            Params:
+                symbols:
+                    numpy array of symbols
+                quantities:
+                    numpy int array of quantities desired
+                directions:
+                    numpy array of "BUY" or "SELL"
+        """
+        self.type = "ORDER_BATCH"
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+class FillBatchEvent(Event):
+    """
+        generated by execution
+        handled by portfolio
+        models what was filled from an OrderBatchEvent
+    """
+
+    @params_to_attr
+    def __init__(self, symbols, quantities, directions, fill_costs=None, commissions=None):
+        """
+            Params:
+                symbols:
+                    numpy array of symbols
+                quantities:
+                    numpy int array of quantities filled
+                directions:
+                    numpy array of "BUY" or "SELL"
+                fill_costs:
+                    numpy float array of fill prices, as FillEvent.fill_cost None
+                    leaves the portfolio to price the fills at the latest adj_close
+                commissions:
+                    numpy float array, as FillEvent.commission not yet charged
+        """
+        self.type = "FILL_BATCH"
+
+    def __len__(self):
+        return len(self.symbols)
+
+
 ##############################################################
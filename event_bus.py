@@ -0,0 +1,58 @@
+import queue
+from collections import deque
+
+
+class EventLane:
+    """
+        put only handle on one priority lane of an EventBus, for code that is
+        given somewhere to put events, eg a stratergy's events_priotity_2
+    """
+
+    def __init__(self, bus, priority):
+        self.bus = bus
+        self.priority = priority
+
+    def put(self, event):
+        self.bus.put(event, self.priority)
+
+
+class EventBus:
+    """
+        Single threaded replacement for queue.Queue in the backtest loop
+
+        events are kept in one deque per priority lane, priority 1 is the highest.
+        get always takes the oldest event of the highest priority lane that has one,
+        so a lane is only drained once every lane above it is empty.
+
+        there is no locking, it must only be used from one thread
+    """
+
+    def __init__(self, priorities=2):
+        """
+            Params:
+                priorities:
+                    number of priority lanes, events are put in lanes 1 to priorities
+        """
+        self.lanes = [deque() for _ in range(priorities)]
+
+    def put(self, event, priority=1):
+        self.lanes[priority - 1].append(event)
+
+    def get(self, block=False):
+        """
+            returns the next event, raises queue.Empty when every lane is empty
+            block is accepted for compatibility with queue.Queue and ignored
+        """
+        for lane in self.lanes:
+            if lane:
+                return lane.popleft()
+        raise queue.Empty
+
+    def empty(self):
+        return not any(self.lanes)
+
+    def qsize(self):
+        return sum(len(lane) for lane in self.lanes)
+
+    def lane(self, priority):
+        return EventLane(self, priority)
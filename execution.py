@@ -1,7 +1,7 @@
 from data import DataHandler
 from portfolio import Portfolio
 from stratergy import Stratergy
-from event import FillEvent, OrderEvent
+from event import FillEvent, OrderEvent, FillBatchEvent
 
 
 class ExecutionHandler:
@@ -23,6 +23,17 @@ class ExecutionHandler:
         )
         self.events.put(fill)
 
+    def execute_order_batch(self, event):
+        """
+            fills every order of the batch in full, as execute_order does
+        """
+        fill = FillBatchEvent(
+            symbols=event.symbols,
+            quantities=event.quantities,
+            directions=event.directions,
+        )
+        self.events.put(fill)
+
 
 # if __name__ == "__main__":
 
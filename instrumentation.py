@@ -0,0 +1,164 @@
+import json
+import time
+
+import numpy as np
+
+# per bar latency histogram edges in seconds, 1 microsecond to 10 seconds
+LATENCY_BIN_EDGES = np.logspace(-6, 1, 43)
+
+
+class Timer:
+    """
+        count and cumulative seconds of the calls to one function
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def wrap(self, func):
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds += perf_counter() - start
+                self.count += 1
+
+        return timed
+
+    def report(self):
+        return {"count": self.count, "seconds": self.seconds}
+
+
+class Instrumentation:
+    """
+        Hot path timings of a Backtest
+
+        attaching replaces the methods being measured on the backtest's instances
+        with timed wrappers, so a backtest that is never instrumented runs exactly
+        the code it would otherwise.
+
+        measures
+            dispatch:     count and time of each event type's handler, inclusive of
+                          anything handled inside it (a market event includes the
+                          stratergys, portfolio update and the resulting orders)
+            components:   DataHandler.update_bars, each stratergy's calculate_signal,
+                          each Portfolio.update and ExecutionHandler.execute_order
+                          and execute_order_batch
+            bars:         bars per second and a histogram of the time from the start
+                          of update_bars to the last event of that bar being handled
+    """
+
+    def __init__(self, backtest):
+        self.dispatch = {}
+        self.components = {}
+        self.bar_counts = np.zeros(len(LATENCY_BIN_EDGES) + 1, dtype=np.int64)
+        self.bars = 0
+        self.bar_seconds = 0.0
+        self.max_bar_seconds = 0.0
+        self.wall_seconds = 0.0
+        self._bar_start = None
+        self._run_start = None
+        self.attach(backtest)
+
+    def _timer(self, table, name):
+        if name not in table:
+            table[name] = Timer()
+        return table[name]
+
+    def _wrap_handlers(self, handlers):
+        for event_cls, handler in list(handlers.items()):
+            handlers[event_cls] = self._timer(self.dispatch, event_cls.__name__).wrap(
+                handler
+            )
+
+    def _wrap_method(self, obj, method_name, name):
+        setattr(
+            obj,
+            method_name,
+            self._timer(self.components, name).wrap(getattr(obj, method_name)),
+        )
+
+    def attach(self, backtest):
+        data_handler = backtest.data_handler
+        update_bars = self._timer(self.components, "DataHandler.update_bars").wrap(
+            data_handler.update_bars
+        )
+
+        def timed_update_bars():
+            start = time.perf_counter()
+            update_bars()
+            # the last call only marks the data handler finished, it is not a bar
+            if not data_handler.finished:
+                self._bar_start = start
+
+        data_handler.update_bars = timed_update_bars
+
+        handle_events = backtest.handle_events
+
+        def timed_handle_events():
+            handle_events()
+            if self._bar_start is not None:
+                self.record_bar(time.perf_counter() - self._bar_start)
+                self._bar_start = None
+
+        backtest.handle_events = timed_handle_events
+
+        self._wrap_handlers(backtest.handlers)
+        for i, book in enumerate(backtest.books):
+            self._wrap_handlers(book.handlers)
+            self._wrap_method(
+                book.stratergy,
+                "calculate_signal",
+                "stratergy[{}].{}.calculate_signal".format(
+                    i, type(book.stratergy).__name__
+                ),
+            )
+            self._wrap_method(book.portfolio, "update", "Portfolio.update")
+            for method_name in ("execute_order", "execute_order_batch"):
+                if hasattr(book.execution_handler, method_name):
+                    self._wrap_method(
+                        book.execution_handler,
+                        method_name,
+                        "ExecutionHandler." + method_name,
+                    )
+
+    def record_bar(self, seconds):
+        self.bars += 1
+        self.bar_seconds += seconds
+        if seconds > self.max_bar_seconds:
+            self.max_bar_seconds = seconds
+        self.bar_counts[np.searchsorted(LATENCY_BIN_EDGES, seconds, side="right")] += 1
+
+    def start(self):
+        self._run_start = time.perf_counter()
+
+    def stop(self):
+        self.wall_seconds += time.perf_counter() - self._run_start
+
+    def report(self):
+        """
+            returns the measurements as a dict of plain python types
+        """
+        return {
+            "bars": self.bars,
+            "wall_seconds": self.wall_seconds,
+            "bars_per_sec": self.bars / self.wall_seconds if self.wall_seconds else None,
+            "dispatch": {k: t.report() for k, t in self.dispatch.items()},
+            "components": {k: t.report() for k, t in self.components.items()},
+            "bar_latency": {
+                "mean_seconds": self.bar_seconds / self.bars if self.bars else None,
+                "max_seconds": self.max_bar_seconds,
+                # counts[i] is the number of bars under bin_edges[i] and at or over
+                # bin_edges[i - 1], the last count is everything over the last edge
+                "bin_edges_seconds": LATENCY_BIN_EDGES.tolist(),
+                "counts": self.bar_counts.tolist(),
+            },
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
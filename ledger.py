@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+
+# rows allocated when the number of bars is not known up front
+DEFAULT_CAPACITY = 1024
+
+
+class Ledger:
+    """
+        Preallocated history of a portfolio's positions and holdings, one row per bar
+
+        row 0 is the starting entry, every later row is written in place by
+        Portfolio.update. when the rows run out the arrays are doubled, so a data
+        handler that does not know its number of bars up front still works
+
+        Data:
+            datetimes:
+                Type:
+                    numpy datetime64[ns] array of shape (capacity,)
+            positions:
+                Type:
+                    numpy float64 array of shape (capacity, n_symbols)
+                Description:
+                    number of shares of each symbol held at the bar
+            market_values:
+                Type:
+                    numpy float64 array of shape (capacity, n_symbols)
+                Description:
+                    positions marked to the bar's adj_close
+            cash, total:
+                Type:
+                    numpy float64 arrays of shape (capacity,)
+            n:
+                number of rows written, only [:n] of each array is valid
+            scratch:
+                Type:
+                    numpy float64 array of shape (n_symbols + 1,)
+                Description:
+                    work row Portfolio.update sums cash and market values in, so
+                    no array is allocated per bar
+    """
+
+    def __init__(self, symbol_list, starting_capital, start_date=None, capacity=None):
+        """
+            Params:
+                capacity:
+                    rows to allocate including the starting entry, eg the number of
+                    bars plus one, None uses DEFAULT_CAPACITY
+        """
+        self.symbol_list = list(symbol_list)
+        capacity = max(capacity or DEFAULT_CAPACITY, 1)
+        n_symbols = len(self.symbol_list)
+
+        self.datetimes = np.full(capacity, np.datetime64("NaT"), dtype="datetime64[ns]")
+        self.positions = np.zeros((capacity, n_symbols))
+        self.market_values = np.zeros((capacity, n_symbols))
+        self.cash = np.zeros(capacity)
+        self.total = np.zeros(capacity)
+        self.scratch = np.zeros(n_symbols + 1)
+
+        self.datetimes[0] = _to_datetime64(start_date)
+        self.cash[0] = starting_capital
+        self.total[0] = starting_capital
+        self.n = 1
+
+    def __len__(self):
+        return self.n
+
+    def _reserve(self, rows):
+        capacity = len(self.cash)
+        if self.n + rows <= capacity:
+            return
+        while capacity < self.n + rows:
+            capacity *= 2
+        for name in ("datetimes", "positions", "market_values", "cash", "total"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: self.n] = old[: self.n]
+            setattr(self, name, new)
+
+    def next_row(self, timestamp):
+        """
+            returns the index of a new row for timestamp, the caller fills it in
+        """
+        self._reserve(1)
+        i = self.n
+        self.datetimes[i] = _to_datetime64(timestamp)
+        self.n += 1
+        return i
+
+    def extend(self, datetimes, positions, market_values, cash, total):
+        """
+            appends many rows at once, each argument has one entry per row
+        """
+        rows = len(cash)
+        self._reserve(rows)
+        end = self.n + rows
+        self.datetimes[self.n : end] = np.asarray(datetimes, dtype="datetime64[ns]")
+        self.positions[self.n : end] = positions
+        self.market_values[self.n : end] = market_values
+        self.cash[self.n : end] = cash
+        self.total[self.n : end] = total
+        self.n = end
+
+    def total_curve(self):
+        """
+            view of the total holdings of every row written, no copy is made
+        """
+        return self.total[: self.n]
+
+    def holdings_frame(self):
+        """
+            DataFrame of the holdings with the columns of the old list of dicts,
+            one per symbol then "datetime", "cash" and "total"
+        """
+        n = self.n
+        return self._frame(
+            self.market_values[:n],
+            {"datetime": self.datetimes[:n], "cash": self.cash[:n], "total": self.total[:n]},
+        )
+
+    def positions_frame(self):
+        n = self.n
+        return self._frame(self.positions[:n], {"datetime": self.datetimes[:n]})
+
+    def _frame(self, per_symbol, extra):
+        # the symbol columns stay one block rather than one block per symbol
+        return pd.concat(
+            [
+                pd.DataFrame(per_symbol, columns=self.symbol_list, copy=False),
+                pd.DataFrame(extra, copy=False),
+            ],
+            axis=1,
+        )
+
+    def holdings_records(self):
+        return self.holdings_frame().to_dict("records")
+
+    def positions_records(self):
+        return self.positions_frame().to_dict("records")
+
+
+def _to_datetime64(timestamp):
+    if timestamp is None:
+        return np.datetime64("NaT")
+    return np.datetime64(pd.Timestamp(timestamp).to_datetime64(), "ns")
@@ -1,18 +1,20 @@
 from stratergy import Stratergy
 from data import DataHandler
 from portfolio import Portfolio
-from event import SignalEvent
+from event import SignalEvent, SignalBatchEvent
 from backtest import Backtest
 from execution import ExecutionHandler
 from my_utils import params_to_attr
 
 import datetime
-import statsmodels.api as sm
+import numpy as np
 
 
 class OLSMRStratergy(Stratergy):
     @params_to_attr
-    def __init__(self, data, events, ols_window=30, zscore_low=0.5, zscore_high=3.0):
+    def __init__(
+        self, data, events, ols_window=30, zscore_low=0.5, zscore_high=3.0, pair=None
+    ):
         """
             Params:
                 data: dataHandler
@@ -23,14 +25,21 @@ class OLSMRStratergy(Stratergy):
                     used as enter and exit flags 
                     zscore_low:
                     zscore_high:
+                pair: (y, x) symbols traded, defaults to the first two of data.symbol_list
         """
 
-        self.pair = ("AREX", "WLL")
+        self.lookback = ols_window
+        if pair is None:
+            self.pair = tuple(data.symbol_list[:2])
         self.datetime = datetime.datetime.utcnow()
 
         self.long_market = False
         self.short_market = False
 
+    @classmethod
+    def required_lookback(cls, **params):
+        return params.get("ols_window", 30)
+
     def calculate_xy_signal(self, zscore_last):
 
         y_signal = None
@@ -64,14 +73,17 @@ class OLSMRStratergy(Stratergy):
 
     def calculate_signal(self):
         """
-            gets windowed data and calculates zscores and puts events in Queue
+            gets windowed data and calculates zscores and puts the pair's signals
+            in the Queue as one SignalBatchEvent
         """
         y = self.data.get_bar_values(self.pair[0], "adj_close", N=self.ols_window)
         x = self.data.get_bar_values(self.pair[1], "adj_close", N=self.ols_window)
 
         if y is not None and x is not None:
             if len(y) >= self.ols_window and len(x) >= self.ols_window:
-                # get hedge ratio
+                # get hedge ratio, statsmodels is only imported once there is a fit to do
+                import statsmodels.api as sm
+
                 self.hedge_ratio = sm.OLS(y, x).fit().params[0]
 
                 # get z score of residuals
@@ -81,8 +93,14 @@ class OLSMRStratergy(Stratergy):
                 # calculate signals and add to events queue
                 y_signal, x_signal = self.calculate_xy_signal(zscore_last)
                 if y_signal is not None and x_signal is not None:
-                    self.events.put(y_signal)
-                    self.events.put(x_signal)
+                    self.events.put(
+                        SignalBatchEvent(
+                            np.array([y_signal.symbol, x_signal.symbol]),
+                            self.datetime,
+                            np.array([y_signal.signal_type, x_signal.signal_type]),
+                            np.array([y_signal.strength, x_signal.strength]),
+                        )
+                    )
 
 
 if __name__ == "__main__":
@@ -8,17 +8,19 @@ def params_to_attr(func):
 
     def wrapper(*args, **kwargs):
         self_var = args[0]
-        argSpec = inspect.getargspec(func)
+        argSpec = inspect.getfullargspec(func)
         argNames = argSpec[0][1:]
-        for key, _ in kwargs.items():
-            if key in argNames:
-                argNames.remove(key)
-        argDict = zip(argNames, args[1:])
 
+        # defaults line up with the full list of names, before kwargs are removed
         if hasattr(argSpec, "defaults") and argSpec.defaults != None:
             amount_of_defaults = len(argSpec.defaults)
             defaults = zip(argNames[-amount_of_defaults:], argSpec.defaults)
             self_var.__dict__.update(defaults)
+
+        for key, _ in kwargs.items():
+            if key in argNames:
+                argNames.remove(key)
+        argDict = zip(argNames, args[1:])
         self_var.__dict__.update(argDict)
         self_var.__dict__.update(kwargs)
         return func(*args, **kwargs)
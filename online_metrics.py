@@ -0,0 +1,92 @@
+import math
+
+
+class OnlineMetrics:
+    """
+        Summary stats of a portfolio kept up to date one bar at a time
+
+        each update takes the bar's total holdings and costs O(1) time and memory,
+        so stats can be read at any point of a long or live run without keeping or
+        rescanning the history. once every bar has been seen the stats are those of
+        Portfolio.summary_stats
+
+        Data:
+            mean, m2:
+                Welford running mean and sum of squared deviations of the returns
+            high_water_mark:
+                highest equity seen, equity is the total over the starting capital
+            drawdown, duration:
+                current drawdown below the high water mark and bars spent in it
+            max_drawdown, max_duration:
+                largest of each so far
+    """
+
+    def __init__(self, starting_capital, periods=252):
+        """
+            Params:
+                starting_capital:
+                    total holdings before the first bar
+                periods:
+                    bars in a year, as Portfolio.create_sharp_ratio
+        """
+        self.starting_capital = starting_capital
+        self.periods = periods
+        self.last_total = starting_capital
+        self.bars = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.equity = 1.0
+        self.high_water_mark = 0.0
+        self.drawdown = 0.0
+        self.duration = 0
+        self.max_drawdown = 0.0
+        self.max_duration = 0
+
+    def update(self, total):
+        """
+            adds one bar given its total holdings
+        """
+        ret = total / self.last_total - 1.0
+        self.last_total = total
+        self.bars += 1
+
+        delta = ret - self.mean
+        self.mean += delta / self.bars
+        self.m2 += delta * (ret - self.mean)
+
+        self.equity = total / self.starting_capital
+        if self.equity > self.high_water_mark:
+            self.high_water_mark = self.equity
+        self.drawdown = self.high_water_mark - self.equity
+        self.duration = 0 if self.drawdown == 0 else self.duration + 1
+        if self.drawdown > self.max_drawdown:
+            self.max_drawdown = self.drawdown
+        if self.duration > self.max_duration:
+            self.max_duration = self.duration
+
+    def extend(self, totals):
+        for total in totals:
+            self.update(float(total))
+
+    def sharp_ratio(self):
+        if self.bars == 0:
+            return math.nan
+        std = math.sqrt(self.m2 / self.bars)
+        if std == 0:
+            return math.nan
+        return math.sqrt(self.periods) * self.mean / std
+
+    def stats(self):
+        """
+            returns the stats so far with the keys of Portfolio.summary_stats, plus
+            the current drawdown and its duration and the number of bars seen
+        """
+        return {
+            "total_return": self.equity - 1.0,
+            "sharp_ratio": self.sharp_ratio(),
+            "max_drawdown": self.max_drawdown,
+            "drawdown_duration": float(self.max_duration),
+            "current_drawdown": self.drawdown,
+            "current_drawdown_duration": self.duration,
+            "bars": self.bars,
+        }
@@ -0,0 +1,201 @@
+import json
+import os
+import queue
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from data import DataHandler
+from csv_cache import BAR_FIELDS
+
+PANEL_DIR_NAME = "panel"
+
+
+def build_panel(csv_dir, symbol_list, panel_path=None, use_cache=False):
+    """
+        Aligns the csv files of symbol_list and writes them as a single panel
+
+        the panel folder holds
+            bars.npy        float64 array of shape (n_bars, n_symbols, n_fields)
+            datetime.npy    datetime64[ns] index shared by every symbol
+            meta.json       symbols and fields in the order of the bars axes, and
+                            the path, size and mtime of each csv it was built from
+
+        the panel is built in a temporary folder that then replaces panel_path, so
+        processes that still map the old panel keep reading it rather than a
+        truncated file
+
+        returns the panel_path
+    """
+    if panel_path is None:
+        panel_path = os.path.join(csv_dir, PANEL_DIR_NAME)
+    panel_path = os.path.abspath(panel_path)
+    build_path = "{}.{}.tmp".format(panel_path, os.getpid())
+    shutil.rmtree(build_path, ignore_errors=True)
+    os.makedirs(build_path)
+
+    sources = [
+        _source_key(os.path.join(csv_dir, "{}.csv".format(s))) for s in symbol_list
+    ]
+    data = DataHandler(queue.Queue(), csv_dir, symbol_list, use_cache=use_cache)
+
+    bars = np.lib.format.open_memmap(
+        os.path.join(build_path, "bars.npy"),
+        mode="w+",
+        dtype=np.float64,
+        shape=(data.num_bars, len(symbol_list), len(BAR_FIELDS)),
+    )
+    for j, s in enumerate(symbol_list):
+        for k, key in enumerate(BAR_FIELDS):
+            bars[:, j, k] = data.symbol_data[s][key]
+    bars.flush()
+    del bars
+
+    np.save(
+        os.path.join(build_path, "datetime.npy"),
+        data.bar_index.values.astype("datetime64[ns]"),
+    )
+    with open(os.path.join(build_path, "meta.json"), "w") as f:
+        json.dump(
+            {"symbols": list(symbol_list), "fields": list(BAR_FIELDS), "sources": sources},
+            f,
+        )
+
+    # a folder can not be renamed over a non empty one, the old panel is moved
+    # aside first and removed once the new one is in place
+    old_path = "{}.{}.old".format(panel_path, os.getpid())
+    if os.path.exists(panel_path):
+        os.replace(panel_path, old_path)
+    os.replace(build_path, panel_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return panel_path
+
+
+def _source_key(csv_path):
+    stat = os.stat(csv_path)
+    return {
+        "source": os.path.abspath(csv_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def is_current(panel_path):
+    """
+        True when every csv the panel was built from is unchanged since, by size
+        and mtime as csv_cache.CsvCache
+    """
+    try:
+        with open(os.path.join(panel_path, "meta.json")) as f:
+            sources = json.load(f)["sources"]
+        return all(_source_key(key["source"]) == key for key in sources)
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def open_panel(panel_path):
+    """
+        memory maps a panel read only, the pages are shared through the OS page cache
+        between every process that opens the same panel
+
+        returns (datetime array, symbols, fields, bars)
+    """
+    with open(os.path.join(panel_path, "meta.json")) as f:
+        meta = json.load(f)
+    datetimes = np.load(os.path.join(panel_path, "datetime.npy"), mmap_mode="r")
+    bars = np.load(os.path.join(panel_path, "bars.npy"), mmap_mode="r")
+    return datetimes, meta["symbols"], meta["fields"], bars
+
+
+class PanelDataHandler(DataHandler):
+    """
+        DataHandler that serves bars from a memory mapped panel built by build_panel
+
+        symbol_data[s][field] are strided views into the panel so no bar data is
+        copied into the process, resident memory only grows with the pages read
+    """
+
+    def __init__(
+        self,
+        events,
+        csv_dir,
+        symbol_list,
+        start_date=None,
+        end_date=None,
+        panel_path=None,
+        warmup_bars=0,
+        panel=None,
+    ):
+        """
+            Params:
+                same as DataHandler
+                panel_path:
+                    folder written by build_panel, defaults to csv_dir/panel
+                panel:
+                    (datetimes, symbols, fields, bars) already in memory, eg attached
+                    from shared memory, used instead of panel_path
+        """
+        if panel_path is None:
+            panel_path = os.path.join(csv_dir, PANEL_DIR_NAME)
+        self.panel_path = panel_path
+        self.panel = panel
+        super().__init__(
+            events, csv_dir, symbol_list, start_date, end_date, warmup_bars=warmup_bars
+        )
+
+    def open_convert_csv_files(self, symbol_list, csv_dir, start_date, end_date):
+        """
+            maps the panel and points self.symbol_data[s][field] at its columns,
+            ValueError when a csv it was built from has changed since
+        """
+        if self.panel is not None:
+            datetimes, symbols, fields, bars = self.panel
+        else:
+            if not is_current(self.panel_path):
+                raise ValueError(
+                    "panel {} is missing or older than its csv files, rebuild it with "
+                    "build_panel".format(self.panel_path)
+                )
+            datetimes, symbols, fields, bars = open_panel(self.panel_path)
+        self.attach_panel(datetimes, symbols, fields, bars, start_date, end_date)
+
+    def attach_panel(self, datetimes, symbols, fields, bars, start_date, end_date):
+        """
+            points self.symbol_data[s][field] at the panel columns between start_date
+            and end_date and builds self.listed from where adj_close is not nan
+        """
+        index = pd.DatetimeIndex(datetimes)
+        first = 0 if start_date is None else index.searchsorted(pd.Timestamp(start_date))
+        last = (
+            len(index)
+            if end_date is None
+            else index.searchsorted(pd.Timestamp(end_date), side="right")
+        )
+        if start_date is None:
+            self.start_date = index[first]
+        self.bar_cursor = min(self.warmup_bars, first)
+        first -= self.bar_cursor
+
+        self.bars = bars[first:last]
+        self.bar_index = index[first:last]
+        # bars before a symbol lists are nan in the panel, as DataHandler lays them out
+        adj_close = self.bars[:, :, fields.index("adj_close")]
+        listed = np.logical_or.accumulate(~np.isnan(adj_close), axis=0)
+        self.listed = {}
+        for s in self.symbol_list:
+            j = symbols.index(s)
+            self.symbol_data[s] = {
+                key: self.bars[:, j, fields.index(key)] for key in BAR_FIELDS
+            }
+            self.listed[s] = listed[:, j]
+
+        self._datetimes = list(self.bar_index)
+        self.num_bars = len(self._datetimes)
+
+
+if __name__ == "__main__":
+
+    csv_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    symbol_list = ["SPY", "IJS", "EFA", "EEM", "AGG", "JNK", "DJP", "RWR"]
+    print("panel written to {}".format(build_panel(csv_dir, symbol_list)))
@@ -0,0 +1,397 @@
+import asyncio
+import heapq
+import json
+import os
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from backtest import Backtest
+from csv_cache import BAR_FIELDS
+from event import MarketEvent, OrderEvent, OrderBatchEvent
+from streaming import StreamingDataHandler, iter_symbol_rows
+
+
+def iter_merged_bars(csv_dir, symbol_list, start_date=None, end_date=None, chunksize=10000):
+    """
+        yields (datetime as int64 ns, {symbol: row values in BAR_FIELDS order}) for
+        every datetime of the union of the symbol files, only the symbols with a
+        row at that datetime are included. the first bar also holds the last row
+        before start_date of each symbol without a row of its own, so it is padded
+        forward as StreamingDataHandler does
+    """
+    stream = heapq.merge(
+        *[
+            iter_symbol_rows(
+                os.path.join(csv_dir, "{}.csv".format(s)),
+                j,
+                chunksize,
+                start_date,
+                end_date,
+                keep_before=1,
+            )
+            for j, s in enumerate(symbol_list)
+        ],
+        key=lambda row: row[0],
+    )
+    row = next(stream, None)
+    seed = {}
+    if start_date is not None:
+        start = pd.Timestamp(start_date).value
+        while row is not None and row[0] < start:
+            seed[symbol_list[row[1]]] = row[2]
+            row = next(stream, None)
+    while row is not None:
+        timestamp = row[0]
+        bars = seed
+        seed = {}
+        while row is not None and row[0] == timestamp:
+            bars[symbol_list[row[1]]] = row[2]
+            row = next(stream, None)
+        yield timestamp, bars
+
+
+def encode_bar(timestamp, bars):
+    """
+        one bar as a line of json, nan values are sent as null
+    """
+    message = {
+        "datetime": int(timestamp),
+        "bars": {
+            s: [None if np.isnan(v) else float(v) for v in values]
+            for s, values in bars.items()
+        },
+    }
+    return (json.dumps(message) + "\n").encode()
+
+
+def decode_bar(line):
+    message = json.loads(line)
+    bars = {
+        s: np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        for s, values in message["bars"].items()
+    }
+    return pd.Timestamp(message["datetime"]), bars
+
+
+class ReplayServer:
+    """
+        Local stand in for a live bar feed
+
+        every client that connects is sent the bars of the csv files in csv_dir in
+        datetime order, one json line per bar (see encode_bar), and the connection
+        is closed after the last bar
+    """
+
+    def __init__(
+        self,
+        csv_dir,
+        symbol_list,
+        start_date=None,
+        end_date=None,
+        bars_per_second=None,
+        host="127.0.0.1",
+        port=0,
+    ):
+        """
+            Params:
+                csv_dir, symbol_list, start_date, end_date:
+                    same as DataHandler
+                bars_per_second:
+                    rate the bars are sent at, None sends them as fast as the
+                    client reads them
+                host, port:
+                    address to listen on, port 0 picks a free port, see self.port
+                    once start has returned
+        """
+        self.csv_dir = csv_dir
+        self.symbol_list = symbol_list
+        self.start_date = start_date
+        self.end_date = end_date
+        self.bars_per_second = bars_per_second
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        interval = None if not self.bars_per_second else 1.0 / self.bars_per_second
+        next_send = time.perf_counter()
+        try:
+            for timestamp, bars in iter_merged_bars(
+                self.csv_dir, self.symbol_list, self.start_date, self.end_date
+            ):
+                if interval is not None:
+                    next_send += interval
+                    delay = next_send - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                writer.write(encode_bar(timestamp, bars))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class SocketBarFeed:
+    """
+        async bar feed reading the json lines sent by a ReplayServer
+
+        a feed is anything that can be used in async for and yields
+        (datetime, {symbol: row values in BAR_FIELDS order}), so a broker's feed can
+        replace it by producing the same pairs
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    async def __aiter__(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                yield decode_bar(line)
+        finally:
+            writer.close()
+
+
+class LiveDataHandler(StreamingDataHandler):
+    """
+        DataHandler fed bars as they arrive instead of reading files
+
+        keeps the same rolling history and accessors as StreamingDataHandler,
+        bars are added with push_bar, update_bars is never called
+    """
+
+    def __init__(
+        self,
+        events,
+        csv_dir,
+        symbol_list,
+        start_date=None,
+        end_date=None,
+        lookback=None,
+        warmup_bars=0,
+    ):
+        """
+            Params:
+                same as StreamingDataHandler, csv_dir and end_date are not used
+                warmup_bars:
+                    must be 0, no bars arrive before the feed starts so there is no
+                    history to warm up on
+        """
+        if warmup_bars:
+            raise ValueError("LiveDataHandler can not warm up, there are no bars before the feed")
+        super().__init__(events, csv_dir, symbol_list, start_date, end_date, lookback=lookback)
+
+    def open_convert_csv_files(self, symbol_list, csv_dir, start_date, end_date):
+        self._symbol_idx = {s: j for j, s in enumerate(symbol_list)}
+        self._last_values = np.full((len(symbol_list), len(BAR_FIELDS)), np.nan)
+        self._warmup = []
+        self.symbol_data = None
+
+    def push_bar(self, timestamp, bars):
+        """
+            adds a bar and puts a MarketEvent, symbols missing from bars are padded
+            forward from their last bar
+        """
+        if self.symbol_data is None:
+            self._allocate_history()
+            if self.start_date is None:
+                self.start_date = timestamp
+        for s, values in bars.items():
+            self._last_values[self._symbol_idx[s]] = values
+        for s, j in self._symbol_idx.items():
+            self.symbol_data[s].append(self._last_values[j])
+        self._datetimes.append(timestamp)
+        self.bar_cursor += 1
+        self.events.put(MarketEvent())
+
+    def update_bars(self):
+        """
+            bars only arrive through push_bar, so the handler can not be driven by
+            Backtest._run_backtest
+        """
+        raise RuntimeError("LiveDataHandler is fed with push_bar")
+
+
+class PaperTrader:
+    """
+        Runs stratergys against an async bar feed as they would run live
+
+        the stratergys, portfolios and execution handlers are built and connected by
+        a Backtest over a LiveDataHandler, each bar from the feed is pushed into the
+        data handler and handled before the next is awaited. the time from a bar
+        being received to each order it causes reaching the execution handler is
+        recorded in self.latencies (seconds)
+    """
+
+    def __init__(
+        self,
+        feed,
+        symbol_list,
+        inital_capital,
+        execution_handler_cls,
+        portfolio_cls,
+        stratergy_cls,
+        stratergy_params=None,
+        lookback=None,
+    ):
+        """
+            Params:
+                feed:
+                    async iterable of (datetime, {symbol: values}), eg SocketBarFeed
+                lookback:
+                    number of bars kept per symbol, None uses the stratergys' lookback
+                others are the same as Backtest
+        """
+        self.feed = feed
+        self.backtest = Backtest(
+            None,
+            symbol_list,
+            inital_capital,
+            None,
+            None,
+            LiveDataHandler,
+            execution_handler_cls,
+            portfolio_cls,
+            stratergy_cls,
+            stratergy_params=stratergy_params,
+        )
+        self.data_handler = self.backtest.data_handler
+        if lookback is not None:
+            self.data_handler.set_lookback(lookback)
+
+        self.bars = 0
+        self.latencies = deque()
+        self._bar_received = None
+        for book in self.backtest.books:
+            self._time_orders(book)
+
+    def _time_orders(self, book):
+        perf_counter = time.perf_counter
+
+        def timed(handle_order):
+            def timed_order(event):
+                latency = perf_counter() - self._bar_received
+                # every order of a batch reaches the execution handler together
+                orders = len(event) if isinstance(event, OrderBatchEvent) else 1
+                self.latencies.extend([latency] * orders)
+                handle_order(event)
+
+            return timed_order
+
+        for event_cls in (OrderEvent, OrderBatchEvent):
+            book.register_handler(event_cls, timed(book.handlers[event_cls]))
+
+    def _start_portfolios(self):
+        # the start date is only known once the first bar arrives, the portfolios'
+        # starting entries are rebuilt with it as a Backtest's are built with start_date
+        for book in self.backtest.books:
+            portfolio = book.portfolio
+            portfolio.ledger = portfolio.construct_ledger()
+            portfolio.current_holdings = portfolio.construct_current_holdings()
+            portfolio.current_positions = portfolio.construct_current_positions()
+
+    def on_bar(self, timestamp, bars):
+        self._bar_received = time.perf_counter()
+        self.data_handler.push_bar(timestamp, bars)
+        if self.bars == 0:
+            self._start_portfolios()
+        self.backtest.handle_events()
+        self.bars += 1
+
+    async def run(self):
+        """
+            handles every bar of the feed until it ends
+        """
+        async for timestamp, bars in self.feed:
+            self.on_bar(timestamp, bars)
+        self.data_handler.finished = True
+
+    def latency_report(self):
+        """
+            returns count and mean, median, 99th percentile and max bar to order
+            latency in seconds
+        """
+        latencies = np.fromiter(self.latencies, dtype=np.float64)
+        if len(latencies) == 0:
+            return {"bars": self.bars, "orders": 0}
+        return {
+            "bars": self.bars,
+            "orders": len(latencies),
+            "mean_seconds": float(latencies.mean()),
+            "median_seconds": float(np.median(latencies)),
+            "p99_seconds": float(np.percentile(latencies, 99)),
+            "max_seconds": float(latencies.max()),
+        }
+
+
+async def paper_trade_replay(
+    csv_dir,
+    symbol_list,
+    inital_capital,
+    execution_handler_cls,
+    portfolio_cls,
+    stratergy_cls,
+    stratergy_params=None,
+    start_date=None,
+    end_date=None,
+    bars_per_second=None,
+):
+    """
+        starts a ReplayServer over csv_dir and paper trades its feed,
+        returns the PaperTrader once every bar has been handled
+    """
+    server = ReplayServer(csv_dir, symbol_list, start_date, end_date, bars_per_second)
+    await server.start()
+    try:
+        trader = PaperTrader(
+            SocketBarFeed(server.host, server.port),
+            symbol_list,
+            inital_capital,
+            execution_handler_cls,
+            portfolio_cls,
+            stratergy_cls,
+            stratergy_params,
+        )
+        await trader.run()
+    finally:
+        await server.stop()
+    return trader
+
+
+if __name__ == "__main__":
+    from execution import ExecutionHandler
+    from portfolio import Portfolio
+    from portfolioBalancingStrat import end_of_month_rebalance_stratergy
+
+    csv_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    symbol_list = ["SPY", "IJS", "EFA", "EEM", "AGG", "JNK", "DJP", "RWR"]
+
+    trader = asyncio.run(
+        paper_trade_replay(
+            csv_dir,
+            symbol_list,
+            100000,
+            ExecutionHandler,
+            Portfolio,
+            end_of_month_rebalance_stratergy,
+            bars_per_second=2000,
+        )
+    )
+    print(trader.latency_report())
+    print(trader.backtest.portfolio.metrics.stats())
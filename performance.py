@@ -0,0 +1,203 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+"""
+    Vectorised performance statistics
+
+    every function works along the last axis, so it takes one curve as a 1d array
+    or many curves (eg the results of a sweep or resampled returns) as a 2d array of
+    shape (n_curves, n_bars) and returns one value, or one row, per curve.
+
+    equity is an equity curve (eg Portfolio.equity_curve["equity_curve"] or the
+    holdings total), returns are per bar percentage returns, nan returns are ignored.
+    periods is the number of bars in a year: daily 252, hourly 252*6.5,
+    minutely 252*6.5*60
+"""
+
+
+def returns_from_equity(equity):
+    """
+        per bar returns of equity, the first bar of each curve is nan
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    returns = np.full(equity.shape, np.nan)
+    returns[..., 1:] = equity[..., 1:] / equity[..., :-1] - 1.0
+    return returns
+
+
+def running_max(equity):
+    """
+        high water mark of equity, nan bars are skipped
+    """
+    return np.fmax.accumulate(np.asarray(equity, dtype=np.float64), axis=-1)
+
+
+def drawdowns(equity, relative=False):
+    """
+        returns (drawdown, max drawdown, max drawdown duration)
+
+        drawdown is the distance of each bar below the high water mark, in the units
+        of equity, or as a fraction of the high water mark when relative. duration
+        is the number of bars in a row spent below it. as Portfolio.create_drawdowns
+        the high water mark starts at 0
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    hwm = np.fmax(running_max(equity), 0.0)
+    drawdown = hwm - equity
+    if relative:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            drawdown = drawdown / hwm
+
+    # bars since the last bar at the high water mark
+    bars = np.arange(equity.shape[-1])
+    last_high = np.maximum.accumulate(np.where(drawdown == 0, bars, 0), axis=-1)
+    duration = bars - last_high
+    return drawdown, np.nanmax(drawdown, axis=-1), duration.max(axis=-1).astype(np.float64)
+
+
+def total_return(equity):
+    equity = np.asarray(equity, dtype=np.float64)
+    return equity[..., -1] / equity[..., 0] - 1.0
+
+
+def cagr(equity, periods=252):
+    """
+        compound annual growth rate from the first to the last bar
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    years = (equity.shape[-1] - 1) / periods
+    return (equity[..., -1] / equity[..., 0]) ** (1.0 / years) - 1.0
+
+
+def volatility(returns, periods=252):
+    """
+        annualised standard deviation of returns
+    """
+    return np.sqrt(periods) * np.nanstd(returns, axis=-1)
+
+
+def sharp_ratio(returns, periods=252):
+    """
+        annualised mean over standard deviation of returns, as Portfolio.create_sharp_ratio
+    """
+    return np.sqrt(periods) * np.nanmean(returns, axis=-1) / np.nanstd(returns, axis=-1)
+
+
+def sortino_ratio(returns, periods=252, target=0.0):
+    """
+        annualised mean excess return over the downside deviation below target
+    """
+    excess = np.asarray(returns, dtype=np.float64) - target
+    downside = np.sqrt(np.nanmean(np.minimum(excess, 0.0) ** 2, axis=-1))
+    return np.sqrt(periods) * np.nanmean(excess, axis=-1) / downside
+
+
+def calmar_ratio(equity, periods=252):
+    """
+        cagr over the max drawdown as a fraction of the high water mark
+    """
+    return cagr(equity, periods) / drawdowns(equity, relative=True)[1]
+
+
+def summary_stats(equity, periods=252):
+    """
+        every statistic of one or many equity curves in one call
+
+        returns dict of name to value, or to array of one value per curve
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    returns = returns_from_equity(equity)
+    _, max_dd, dd_duration = drawdowns(equity)
+    return {
+        "total_return": total_return(equity),
+        "cagr": cagr(equity, periods),
+        "volatility": volatility(returns, periods),
+        "sharp_ratio": sharp_ratio(returns, periods),
+        "sortino_ratio": sortino_ratio(returns, periods),
+        "max_drawdown": max_dd,
+        "drawdown_duration": dd_duration,
+        "calmar_ratio": calmar_ratio(equity, periods),
+    }
+
+
+# Rolling versions, value at bar t covers the window bars ending at t, the first
+# window - 1 bars are nan. means and deviations use running sums so each is one
+# pass whatever the window
+
+
+def _rolling_sum(values, window):
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    cumulative = np.cumsum(values, axis=-1)
+    out = np.full(values.shape, np.nan)
+    out[..., window - 1] = cumulative[..., window - 1]
+    out[..., window:] = cumulative[..., window:] - cumulative[..., :-window]
+    return out
+
+
+def _rolling_mean_std(returns, window):
+    returns = np.asarray(returns, dtype=np.float64)
+    count = _rolling_sum(~np.isnan(returns), window)
+    mean = _rolling_sum(returns, window) / count
+    variance = _rolling_sum(np.square(returns), window) / count - mean ** 2
+    return mean, np.sqrt(np.maximum(variance, 0.0))
+
+
+def rolling_volatility(returns, window, periods=252):
+    return np.sqrt(periods) * _rolling_mean_std(returns, window)[1]
+
+
+def rolling_sharp_ratio(returns, window, periods=252):
+    mean, std = _rolling_mean_std(returns, window)
+    return np.sqrt(periods) * mean / std
+
+
+def rolling_sortino_ratio(returns, window, periods=252, target=0.0):
+    excess = np.asarray(returns, dtype=np.float64) - target
+    count = _rolling_sum(~np.isnan(excess), window)
+    mean = _rolling_sum(excess, window) / count
+    downside = np.sqrt(_rolling_sum(np.minimum(excess, 0.0) ** 2, window) / count)
+    return np.sqrt(periods) * mean / downside
+
+
+def rolling_cagr(equity, window, periods=252):
+    equity = np.asarray(equity, dtype=np.float64)
+    out = np.full(equity.shape, np.nan)
+    out[..., window - 1 :] = (equity[..., window - 1 :] / equity[..., : 1 - window or None]) ** (
+        periods / (window - 1)
+    ) - 1.0
+    return out
+
+
+def rolling_drawdowns(equity, window, relative=False, block_size=None):
+    """
+        returns (max drawdown, max drawdown duration) within each window, the high
+        water mark restarts at the first bar of the window
+
+        unlike the other rolling stats this costs O(n_bars * window) time, as each
+        window is measured on its own. the windows are measured block_size at a
+        time, so the temporaries are (block_size, window) per curve. None picks
+        n_bars // window windows a block, keeping memory O(n_bars) per curve
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    n_bars = equity.shape[-1]
+    n_windows = n_bars - window + 1
+    if block_size is None:
+        block_size = max(n_bars // window, 1)
+
+    max_dd = np.full(equity.shape, np.nan)
+    duration = np.full(equity.shape, np.nan)
+    for first in range(0, n_windows, block_size):
+        last = min(first + block_size, n_windows)
+        windows = sliding_window_view(
+            equity[..., first : last + window - 1], window, axis=-1
+        )
+        _, block_dd, block_duration = drawdowns(windows, relative)
+        max_dd[..., first + window - 1 : last + window - 1] = block_dd
+        duration[..., first + window - 1 : last + window - 1] = block_duration
+    return max_dd, duration
+
+
+def rolling_calmar_ratio(equity, window, periods=252):
+    return rolling_cagr(equity, window, periods) / rolling_drawdowns(
+        equity, window, relative=True
+    )[0]
@@ -1,8 +1,10 @@
 from data import DataHandler
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from event import OrderEvent
+from event import OrderEvent, OrderBatchEvent
+from ledger import Ledger
+import performance
+from online_metrics import OnlineMetrics
 import queue
 import math
 
@@ -29,7 +31,11 @@ import math
 class Portfolio:
     """
         Data
-        holdings: array of dict that store date and cash
+        ledger: Ledger of preallocated arrays, one row per bar of the positions,
+                market value of each symbol, cash and total (see ledger.py)
+        metrics: OnlineMetrics fed every bar's total, the summary stats so far
+                 at any point of the run (see online_metrics.py)
+        holdings: array of dict that store date and cash, built from the ledger
             [
                 {"datetime": start_date, "cash":starting cash, "stock_value":0},
                 {"datetime": timestamp, "cash":current cash on hand, "stock_vale": current stock value},
@@ -43,7 +49,7 @@ class Portfolio:
                 "stock_value":
                 "total":
             }
-        positions: array of dict that store date and stock held
+        positions: array of dict that store date and stock held, built from the ledger
             [
                 {"datetime": start_date, "position":0},
                 {"datetime": timestamp, "position":current position held},
@@ -80,64 +86,47 @@ class Portfolio:
         self.dataHandler = dataHandler
         self.symbol_list = dataHandler.symbol_list
         self.starting_capital = starting_capital
-        # Holdings init
-        self.holdings = self.construct_holdings()
+        # Holdings and positions history
+        self.ledger = self.construct_ledger()
+        self.metrics = OnlineMetrics(self.starting_capital)
 
         self.current_holdings = self.construct_current_holdings()
 
         # positions init
-        self.positions = self.construct_positions()
-
         self.current_positions = self.construct_current_positions()
+        # False once a fill changes current_positions after the last ledger row
+        self._positions_unchanged = False
 
         # balance_ratio if needed
         self.balance_ratio = None
 
-    def construct_positions(self):
+    def construct_ledger(self):
         """
             returns:
                 Type:
-                    
+                    Ledger()
                 Description:
-                    list of dictionary of stock : number of stock which is 0
-                Example:
-                    [
-                        {
-                            "datetime" : datetime()
-                            "stock1"   : int
-                            ...
-                            "stocklast": int
-                        }
-                    ]
+                    history with only the starting entry, sized for every bar the
+                    data handler will release when it knows how many there are
         """
-        d = dict((k, v) for k, v in [(s, 0) for s in self.symbol_list])
-        d["datetime"] = self.dataHandler.start_date
-        return [d]
+        capacity = None
+        num_bars = getattr(self.dataHandler, "num_bars", None)
+        if num_bars is not None:
+            capacity = num_bars - self.dataHandler.bar_cursor + 1
+        return Ledger(
+            self.symbol_list,
+            self.starting_capital,
+            self.dataHandler.start_date,
+            capacity,
+        )
 
-    def construct_holdings(self):
-        """
-            returns:
-                Type:
-                    [{string: int, string:datetime}]
-                Description:
-                    list of dictionary of stock : number of stock which is 0
-                Example:
-                    [
-                        {
-                            "datetime" : datetime()
-                            "cash"     : int
-                            "total"    : int
-                            "stock1"   : int
-                            ...
-                            "stocklast": int
-                        }
-                    ]
-        """
-        d = dict((k, v) for k, v in [(s, 0) for s in self.symbol_list])
-        d["datetime"] = self.dataHandler.start_date
-        d["cash"] = self.starting_capital
-        d["total"] = self.starting_capital
-        return [d]
+    @property
+    def holdings(self):
+        return self.ledger.holdings_records()
+
+    @property
+    def positions(self):
+        return self.ledger.positions_records()
 
     def construct_current_positions(self):
         """
@@ -183,58 +172,137 @@ class Portfolio:
 
     def update(self):
         """
-            updates (adds new entry in form of dict) to holdings and positions using the latest data from dataHandler
+            writes a new row of holdings and positions to the ledger using the latest data from dataHandler
 
         """
-        timestamp = self.dataHandler.get_latest_bar(self.symbol_list[0])[0]
+        timestamp = self.dataHandler.get_latest_bar_datetime(self.symbol_list[0])
 
         # avoids duplicating the first entry
         if timestamp != self.dataHandler.start_date:
+            ledger = self.ledger
+            i = ledger.next_row(timestamp)
 
-            # update positions
-            temp_positions = dict((k, v) for k, v in [(s, 0) for s in self.symbol_list])
-            temp_positions["datetime"] = timestamp
-
-            for s in self.symbol_list:
-                temp_positions[s] = self.current_positions[s]
-
-            self.positions.append(temp_positions)
+            # update positions, only read back from current_positions after a fill
+            if self._positions_unchanged:
+                ledger.positions[i] = ledger.positions[i - 1]
+            else:
+                ledger.positions[i] = [self.current_positions[s] for s in self.symbol_list]
+                self._positions_unchanged = True
 
             # update holdings
-            temp_holdings = dict((k, v) for k, v in [(s, 0) for s in self.symbol_list])
-            temp_holdings.update(
-                {
-                    "datetime": timestamp,
-                    "cash": self.current_holdings["cash"],
-                    "total": self.current_holdings["cash"],
-                }
-            )
-
-            for s in self.symbol_list:
-                temp_holdings[s] = self.current_positions[
-                    s
-                ] * self.dataHandler.get_latest_bar_value(s, "adj_close")
-                temp_holdings["total"] += temp_holdings[s]
-
-            self.current_holdings["total"] = temp_holdings["total"]
-
-            self.holdings.append(temp_holdings)
+            prices = self.dataHandler.get_latest_bar_values(self.symbol_list, "adj_close")
+            np.multiply(ledger.positions[i], prices, out=ledger.market_values[i])
+            cash = self.current_holdings["cash"]
+            ledger.cash[i] = cash
+            # accumulated from cash left to right, the order the totals have always
+            # been summed in, so they stay identical to the last bit
+            scratch = ledger.scratch
+            scratch[0] = cash
+            scratch[1:] = ledger.market_values[i]
+            np.add.accumulate(scratch, out=scratch)
+            total = float(scratch[-1])
+            ledger.total[i] = total
+            self.metrics.update(total)
+
+            self.current_holdings["total"] = total
 
     def handle_signal(self, event):
-
-        if event.signal_type == "BUY":
-            desired_cash_value = (
-                self.balance_ratio[event.symbol] * self.current_holdings[-1]["total"]
-            )
-            quantity = math.floor(
-                desired_cash_value
-                / self.dataHandler.get_latest_bar_value(event.symbol, "adj_close")
+        """
+            BUY and SELL signals are sized to balance_ratio[symbol] of the total holdings,
+            or to the signal strength as the ratio when no balance_ratio is set
+            EXIT signals close the whole position in the symbol
+        """
+        if event.signal_type in ("BUY", "SELL"):
+            if self.balance_ratio is not None:
+                ratio = self.balance_ratio[event.symbol]
+            else:
+                ratio = event.strength
+            price = self.dataHandler.get_latest_bar_value(event.symbol, "adj_close")
+            if price == 0:
+                return
+            desired_cash_value = ratio * self.current_holdings["total"]
+            quantity = math.floor(desired_cash_value / price)
+            order = OrderEvent(
+                symbol=event.symbol, quantity=quantity, direction=event.signal_type
             )
-            order = OrderEvent(symbol=event.symbol, quantity=quantity, direction="BUY")
             self.events.put(order)
         elif event.signal_type == "EXIT":
-            quantity = self.current_positions[-1][event.symbol]
-            order = OrderEvent(symbol=event.symbol, quantity=quantity, direction="SELL")
+            quantity = self.current_positions[event.symbol]
+            if quantity > 0:
+                order = OrderEvent(symbol=event.symbol, quantity=quantity, direction="SELL")
+                self.events.put(order)
+            elif quantity < 0:
+                order = OrderEvent(symbol=event.symbol, quantity=-quantity, direction="BUY")
+                self.events.put(order)
+
+    def handle_signal_batch(self, event):
+        """
+            the same sizing as handle_signal for every signal of the batch at once,
+            puts a single OrderBatchEvent with the orders in the order of the signals
+        """
+        symbols = np.asarray(event.symbols)
+        signal_types = np.asarray(event.signal_types)
+        prices = self.dataHandler.get_latest_bar_values(symbols, "adj_close")
+
+        trade = (signal_types == "BUY") | (signal_types == "SELL")
+        if self.balance_ratio is not None:
+            ratios = np.array([self.balance_ratio[s] for s in symbols], dtype=np.float64)
+        else:
+            ratios = np.asarray(event.strengths, dtype=np.float64)
+        trade &= prices != 0
+        trade_quantities = np.zeros(len(symbols))
+        trade_quantities[trade] = np.floor(
+            ratios[trade] * self.current_holdings["total"] / prices[trade]
+        )
+
+        held = np.array([self.current_positions[s] for s in symbols])
+        exits = (signal_types == "EXIT") & (held != 0)
+
+        keep = trade | exits
+        if not keep.any():
+            return
+        quantities = np.where(exits, np.abs(held), trade_quantities)
+        directions = np.where(exits, np.where(held > 0, "SELL", "BUY"), signal_types)
+        self.events.put(
+            OrderBatchEvent(
+                symbols=symbols[keep],
+                quantities=quantities[keep].astype(np.int64),
+                directions=directions[keep],
+            )
+        )
+
+    def handle_target_weights(self, event):
+        """
+            rebalances event.symbols to their target weights with one OrderBatchEvent
+
+            the target of each symbol is floor(weight * total / adj_close) shares, the
+            rounding handle_signal and VectorisedBacktest use, or 0 when it has no
+            price. only the difference from the current position is ordered and the
+            sells come before the buys so their cash is in place first
+        """
+        symbols = np.asarray(event.symbols)
+        weights = np.nan_to_num(np.asarray(event.weights, dtype=np.float64))
+        prices = self.dataHandler.get_latest_bar_values(symbols, "adj_close")
+        held = np.array([self.current_positions[s] for s in symbols], dtype=np.float64)
+
+        target = np.zeros(len(symbols))
+        tradable = (weights != 0) & (prices != 0)
+        target[tradable] = np.floor(
+            weights[tradable] * self.current_holdings["total"] / prices[tradable]
+        )
+        delta = target - held
+
+        trades = np.flatnonzero(delta != 0)
+        if len(trades) == 0:
+            return
+        trades = trades[np.argsort(delta[trades] > 0, kind="stable")]
+        self.events.put(
+            OrderBatchEvent(
+                symbols=symbols[trades],
+                quantities=np.abs(delta[trades]).astype(np.int64),
+                directions=np.where(delta[trades] > 0, "BUY", "SELL"),
+            )
+        )
 
     def update_positions_from_fill(self, fill_event):
         directions = {"BUY": 1, "SELL": -1}
@@ -265,11 +333,24 @@ class Portfolio:
         """
         self.update_positions_from_fill(event)
         self.update_holdings_from_fill(event)
+        self._positions_unchanged = False
+
+    def process_fill_batch(self, event):
+        """
+            process_fill for every fill of a FillBatchEvent
+        """
+        signs = np.where(event.directions == "BUY", 1, -1)
+        prices = self.dataHandler.get_latest_bar_values(event.symbols, "adj_close")
+        for symbol, change, price in zip(event.symbols, signs * event.quantities, prices):
+            self.current_positions[symbol] += int(change)
+            self.current_holdings[symbol] = self.current_positions[symbol] * float(price)
+        self.current_holdings["cash"] -= float(np.sum(signs * prices * event.quantities))
+        self._positions_unchanged = False
 
     # Stats section
 
     def create_equity_curve(self):
-        curve = pd.DataFrame(self.holdings)
+        curve = self.ledger.holdings_frame()
         curve.set_index("datetime")
         curve["returns"] = curve["total"].pct_change()
         curve["equity_curve"] = (1.0 + curve["returns"]).cumprod()
@@ -280,27 +361,21 @@ class Portfolio:
             returns is a pandas series of percentage returns
             periods can be daily 252, hourly 252*6.5, minutely 252*6.5*60
         """
-        return np.sqrt(periods) * (np.mean(returns) / np.std(returns))
+        return performance.sharp_ratio(returns.to_numpy(), periods)
 
     def create_drawdowns(self, pnl):
         """
             keeps track of the largest peak-to-trough drawdown of the Pnl curve and duration of drawdone
-            Pnl is a pandas series of percentage returns
+            Pnl is a pandas series of the equity curve
         """
+        drawdown, max_dd, dd_duration = performance.drawdowns(pnl.to_numpy())
+        return pd.Series(drawdown, index=pnl.index), max_dd, dd_duration
 
-        hwm = [0]
-        drawdown = pd.Series(index=pnl.index)
-        duration = pd.Series(index=pnl.index)
-
-        for t in range(1, len(pnl.index)):
-            hwm.append(max(hwm[t - 1], pnl[t]))
-            drawdown[t] = hwm[t] - pnl[t]
-            duration[t] = 0 if drawdown[t] == 0 else duration[t - 1] + 1
-
-        return drawdown, drawdown.max(), duration.max()
-
-    def output_summary_stats(self):
-
+    def summary_stats(self):
+        """
+            builds the equity curve and returns the summary stats as numbers
+            {"total_return": , "sharp_ratio": , "max_drawdown": , "drawdown_duration": }
+        """
         self.create_equity_curve()
 
         total_return = self.equity_curve["equity_curve"].iloc[-1]
@@ -311,17 +386,35 @@ class Portfolio:
         drawdown, max_dd, dd_duration = self.create_drawdowns(pnl)
         self.equity_curve["drawdown"] = drawdown
 
+        return {
+            "total_return": total_return - 1.0,
+            "sharp_ratio": sharp_ratio,
+            "max_drawdown": max_dd,
+            "drawdown_duration": dd_duration,
+        }
+
+    def output_summary_stats(self, equity_path="equity.csv"):
+        """
+            returns the summary stats formatted for printing and writes the equity
+            curve to equity_path, nothing is written when equity_path is None
+        """
+        summary = self.summary_stats()
+
         stats = [
-            ("Total Return", "{}%".format(round((total_return - 1.0) * 100, 2))),
-            ("Sharp Ratio", "{}".format(round(sharp_ratio, 2))),
-            ("Max Drawdown", "{}".format(round(max_dd * 100, 2))),
-            ("Drawdown Duration", "{}".format(dd_duration)),
+            ("Total Return", "{}%".format(round(summary["total_return"] * 100, 2))),
+            ("Sharp Ratio", "{}".format(round(summary["sharp_ratio"], 2))),
+            ("Max Drawdown", "{}".format(round(summary["max_drawdown"] * 100, 2))),
+            ("Drawdown Duration", "{}".format(summary["drawdown_duration"])),
         ]
 
-        self.equity_curve.to_csv("equity.csv")
+        if equity_path is not None:
+            self.equity_curve.to_csv(equity_path)
         return stats
 
     def display_results(self):
+        # matplotlib is only imported when plotting so headless runs never load it
+        import matplotlib.pyplot as plt
+
         # devide figure into 3 parts
         fig = plt.figure()
         ax1 = fig.add_subplot(311)
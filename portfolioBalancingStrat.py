@@ -1,6 +1,6 @@
 from data import DataHandler
 from portfolio import Portfolio
-from event import SignalEvent
+from event import SignalBatchEvent, TargetWeightEvent
 from backtest import Backtest
 from execution import ExecutionHandler
 from my_utils import params_to_attr
@@ -8,15 +8,14 @@ from stratergy import Stratergy
 
 import numpy
 import pandas as pd
-import pandas_datareader.data as web
 import os
 from datetime import datetime
-import statsmodels.api as sm
 import queue
 import calendar
 
 # get data from yahoo finance
 def save_data_from_web():
+    import pandas_datareader.data as web
 
     raw_data = {
         "SPY": web.DataReader(
@@ -52,30 +51,44 @@ def save_data_from_web():
 
 
 class end_of_month_rebalance_stratergy(Stratergy):
-    def __init__(self, symbol_list, data, events, events_priotity_2):
+    def __init__(
+        self, data, events, events_priotity_2=None, balance_ratio=None, netted=True
+    ):
         """
             Params:
-                symbol: list of string symbols that are of interest
-                    ["AAPL", "BRW", ]
                 data: dataHandler of market data
-                    dataHandler object
+                    dataHandler object, the stratergy trades all of data.symbol_list
                 events: event queue
                     Queue object of Event()
-
+                events_priotity_2: event queue for the BUY signals
+                    handled after every EXIT in events, defaults to lane 2 of the
+                    events EventBus
+                balance_ratio: fraction of total holdings to hold in each symbol
+                    {"SPY": 0.5, "AGG": 0.5}, defaults to an equal split
+                netted: when True each rebalance is one TargetWeightEvent and only the
+                    difference from the current positions is traded, when False every
+                    symbol is sold with an EXIT and bought back with a BUY
         """
-        self.symbol_list = symbol_list
+        self.symbol_list = data.symbol_list
         self.data = data
         self.events = events
+        if events_priotity_2 is None:
+            events_priotity_2 = events.lane(2)
         self.events_priotity_2 = events_priotity_2
-        self.previous_date = data.start_date
-        self.tickers_invested = self._create_invested_list(symbol_list)
+        if balance_ratio is None:
+            balance_ratio = {s: 1.0 / len(self.symbol_list) for s in self.symbol_list}
+        self.balance_ratio = balance_ratio
+        self.netted = netted
+        self.previous_day = None
+        self.tickers_invested = self._create_invested_list(self.symbol_list)
 
     def _start_of_month(self, date):
         """
             because the end of the month may fall on a weekend or non trading day
             the stratergy checks to see if the date.day is smaller then the last trading day and rebalances then
+            the first bar of the backtest also counts so the portfolio is invested from the start
         """
-        return self.previous_date > date.day
+        return self.previous_day is None or self.previous_day > date.day
 
     def _create_invested_list(self, symbol_list):
         tickers_invested = {ticker: False for ticker in symbol_list}
@@ -83,20 +96,72 @@ class end_of_month_rebalance_stratergy(Stratergy):
 
     def calculate_signal(self):
         """
-            if its the start of the month sell everything and rebuy everything
+            if its the start of the month rebalance to balance_ratio, as one
+            TargetWeightEvent when netted, otherwise sell everything and rebuy
+            everything with the EXITs and the BUYs each put as one SignalBatchEvent
         """
         bar_date = self.data.get_latest_bar_datetime(self.symbol_list[0])
         if self._start_of_month(bar_date):
-            for symbol in self.tickers_invested:
-                signal = SignalEvent(symbol, bar_date, "EXIT", 1)
-                self.events.put(signal)
-            for symbol in self.symbol_list:
-                """
-                    Check to see if the adj_close isn't nan
-                """
-                if not numpy.isnan(self.data.get_bar_value(symbol, "adj_close")):
-                    signal = SignalEvent(symbol, bar_date, "BUY", 1)
-                    self.events_priotity_2.put(signal)
+            if self.netted:
+                self._put_target_weights(bar_date)
+            else:
+                self._put_exit_and_buy(bar_date)
+        self.previous_day = bar_date.day
+
+    def _put_target_weights(self, bar_date):
+        # symbols that have not started trading are targeted at 0
+        weights = [
+            self.balance_ratio[s] if self.data.is_listed(s) else 0.0
+            for s in self.symbol_list
+        ]
+        self.events.put(
+            TargetWeightEvent(
+                numpy.array(self.symbol_list), bar_date, numpy.array(weights)
+            )
+        )
+
+    def _put_exit_and_buy(self, bar_date):
+        exits = numpy.array(list(self.tickers_invested))
+        self.events.put(
+            SignalBatchEvent(
+                exits,
+                bar_date,
+                numpy.full(len(exits), "EXIT"),
+                numpy.ones(len(exits)),
+            )
+        )
+        # Only buy symbols that have started trading, strength is the target ratio
+        buys = numpy.array([s for s in self.symbol_list if self.data.is_listed(s)])
+        if len(buys) > 0:
+            self.events_priotity_2.put(
+                SignalBatchEvent(
+                    buys,
+                    bar_date,
+                    numpy.full(len(buys), "BUY"),
+                    numpy.array([self.balance_ratio[s] for s in buys]),
+                )
+            )
+
+    def target_weights(self):
+        """
+            the rebalances of calculate_signal over the whole calendar for VectorisedBacktest
+
+            returns numpy array of shape (n_bars, n_symbols), nan rows on bars that do
+            not rebalance, otherwise the target ratio of each symbol (0 if not listed)
+            warmup bars before the data handler's first released bar never rebalance
+        """
+        days = self.data.bar_index.day.to_numpy()
+        rebalance = numpy.zeros(len(days), dtype=bool)
+        rebalance[1:] = days[1:] < days[:-1]
+        rebalance[: self.data.bar_cursor] = False
+        rebalance[self.data.bar_cursor] = True
+
+        weights = numpy.full((len(days), len(self.symbol_list)), numpy.nan)
+        for j, s in enumerate(self.symbol_list):
+            weights[rebalance, j] = numpy.where(
+                self.data.listed[s][rebalance], self.balance_ratio[s], 0.0
+            )
+        return weights
 
 
 if __name__ == "__main__":
@@ -115,10 +180,12 @@ if __name__ == "__main__":
         csv_dir,
         symbol_list,
         initial_capital,
+        None,
+        None,
         DataHandler,
         ExecutionHandler,
         Portfolio,
-        OLSMRStratergy,
+        end_of_month_rebalance_stratergy,
     )
 
     backtest.simulate_trading()
@@ -0,0 +1,329 @@
+import glob
+import json
+import os
+import struct
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from event import FillEvent, FillBatchEvent
+
+"""
+    Append only columnar results file, one per backtest run
+
+    layout
+        MAGIC
+        chunk, chunk, ...
+
+    every chunk is a 4 byte little endian header length, a json header
+    {"table": name, "rows": n, "columns": [[name, dtype], ...]} and then the raw
+    bytes of each column one after the other. tables are
+        meta:       no columns, the header holds "meta", written first
+        equity:     datetime (int64 ns), cash, total
+        positions:  one float64 column per symbol, a row per equity row
+        trades:     datetime (int64 ns), symbol (index into meta symbol_list),
+                    quantity (signed int64), price
+        stats:      no columns, the header holds "stats", written on close
+
+    a run is readable at any point, a chunk cut short by a crash is ignored
+"""
+
+MAGIC = b"BTRESULTS1\n"
+EXTENSION = ".btr"
+
+
+class ResultsWriter:
+    """
+        Writes one stratergy's equity, positions, trades and stats to a results file
+        while the backtest runs
+
+        equity and positions are copied from the portfolio's ledger, trades are
+        recorded by wrapping the fill handlers of the stratergy's book. rows are
+        written chunk_rows at a time, so memory held by the writer stays bounded
+
+        the file is only created on the first write, so a backtest restored from a
+        checkpoint can continue the file of the run it was written by (see set_state)
+    """
+
+    def __init__(self, path, book, data_handler, chunk_rows=4096, meta=None):
+        """
+            Params:
+                path:
+                    results file, created or truncated on the first write
+                book:
+                    StratergyBook whose portfolio and fills are recorded
+                chunk_rows:
+                    rows of equity or trades buffered before they are appended
+                meta:
+                    dict of anything json serialisable describing the run, eg params
+        """
+        self.path = path
+        self.book = book
+        self.portfolio = book.portfolio
+        self.data_handler = data_handler
+        self.symbol_list = list(self.portfolio.symbol_list)
+        self.chunk_rows = chunk_rows
+        self._symbol_idx = {s: j for j, s in enumerate(self.symbol_list)}
+
+        self._written = 0
+        self._trades = {"datetime": [], "symbol": [], "quantity": [], "price": []}
+
+        self.file = None
+        self.meta = {"symbol_list": self.symbol_list}
+        self.meta.update(meta or {})
+        self._wrap_fills()
+
+    def _open(self):
+        self.file = open(self.path, "wb")
+        self.file.write(MAGIC)
+        self._write_chunk("meta", {}, meta=self.meta)
+
+    def get_state(self):
+        """
+            the position of the writer, used by checkpoint. what has been written so
+            far is flushed to disk so the file holds at least offset bytes
+        """
+        if self.file is None:
+            self._open()
+        self.file.flush()
+        return {
+            "path": self.path,
+            "offset": self.file.tell(),
+            "written": self._written,
+            "trades": {k: list(v) for k, v in self._trades.items()},
+        }
+
+    def set_state(self, state):
+        """
+            continues the file of the checkpointed run, anything it appended after
+            the checkpoint is cut off as those bars are run again
+        """
+        if self.file is not None:
+            self.file.close()
+            os.remove(self.path)
+        self.path = state["path"]
+        self.file = open(self.path, "r+b")
+        self.file.truncate(state["offset"])
+        self.file.seek(state["offset"])
+        self._written = state["written"]
+        self._trades = {k: list(v) for k, v in state["trades"].items()}
+
+    def _write_chunk(self, table, columns, **extra):
+        if self.file is None:
+            self._open()
+        header = {
+            "table": table,
+            "rows": len(next(iter(columns.values()))) if columns else 0,
+            "columns": [[name, values.dtype.str] for name, values in columns.items()],
+        }
+        header.update(extra)
+        encoded = json.dumps(header, default=str).encode()
+        self.file.write(struct.pack("<I", len(encoded)))
+        self.file.write(encoded)
+        for values in columns.values():
+            self.file.write(np.ascontiguousarray(values).tobytes())
+
+    def _wrap_fills(self):
+        def recorded(handle_fill):
+            def record_fill(event):
+                if isinstance(event, FillBatchEvent):
+                    self.record_trades(event.symbols, event.quantities, event.directions)
+                else:
+                    self.record_trades([event.symbol], [event.quantity], [event.direction])
+                handle_fill(event)
+
+            return record_fill
+
+        for event_cls in (FillEvent, FillBatchEvent):
+            self.book.register_handler(event_cls, recorded(self.book.handlers[event_cls]))
+
+    def record_trades(self, symbols, quantities, directions):
+        """
+            buffers fills at the latest bar's adj_close, the price the portfolio uses
+        """
+        timestamp = pd.Timestamp(
+            self.data_handler.get_latest_bar_datetime(self.symbol_list[0])
+        ).value
+        prices = self.data_handler.get_latest_bar_values(symbols, "adj_close")
+        signs = np.where(np.asarray(directions) == "BUY", 1, -1)
+        trades = self._trades
+        trades["datetime"].extend([timestamp] * len(prices))
+        trades["symbol"].extend(self._symbol_idx[s] for s in symbols)
+        trades["quantity"].extend((signs * np.asarray(quantities)).tolist())
+        trades["price"].extend(prices.tolist())
+        if len(trades["datetime"]) >= self.chunk_rows:
+            self._flush_trades()
+
+    def _flush_trades(self):
+        trades = self._trades
+        if not trades["datetime"]:
+            return
+        self._write_chunk(
+            "trades",
+            {
+                "datetime": np.array(trades["datetime"], dtype=np.int64),
+                "symbol": np.array(trades["symbol"], dtype=np.int32),
+                "quantity": np.array(trades["quantity"], dtype=np.int64),
+                "price": np.array(trades["price"], dtype=np.float64),
+            },
+        )
+        for values in trades.values():
+            values.clear()
+
+    def _flush_ledger(self):
+        ledger = self.portfolio.ledger
+        start, end = self._written, len(ledger)
+        if end == start:
+            return
+        self._write_chunk(
+            "equity",
+            {
+                "datetime": ledger.datetimes[start:end].view(np.int64),
+                "cash": ledger.cash[start:end],
+                "total": ledger.total[start:end],
+            },
+        )
+        positions = ledger.positions[start:end]
+        self._write_chunk(
+            "positions", {s: positions[:, j] for j, s in enumerate(self.symbol_list)}
+        )
+        self._written = end
+
+    def update(self):
+        """
+            called after every bar, appends the ledger rows once chunk_rows are waiting
+        """
+        if len(self.portfolio.ledger) - self._written >= self.chunk_rows:
+            self._flush_ledger()
+            self.file.flush()
+
+    def flush(self):
+        self._flush_ledger()
+        self._flush_trades()
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self, stats=None):
+        """
+            writes everything still buffered, then stats (a dict, eg summary_stats)
+        """
+        if self.file is None:
+            self._open()
+        self.flush()
+        if stats is not None:
+            self._write_chunk("stats", {}, stats={k: _plain(v) for k, v in stats.items()})
+        self.file.close()
+
+
+def _plain(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _read_chunks(data):
+    """
+        yields (header, {column: numpy array}) for every complete chunk
+    """
+    if not data.startswith(MAGIC):
+        raise ValueError("not a results file")
+    pos = len(MAGIC)
+    while pos + 4 <= len(data):
+        (length,) = struct.unpack_from("<I", data, pos)
+        if pos + 4 + length > len(data):
+            return
+        header = json.loads(data[pos + 4 : pos + 4 + length])
+        pos += 4 + length
+        columns = {}
+        for name, dtype in header["columns"]:
+            dtype = np.dtype(dtype)
+            size = header["rows"] * dtype.itemsize
+            if pos + size > len(data):
+                return
+            columns[name] = np.frombuffer(data, dtype=dtype, count=header["rows"], offset=pos)
+            pos += size
+        yield header, columns
+
+
+def read_results(path):
+    """
+        loads one results file
+
+        returns dict with "meta" and "stats" dicts and "equity", "positions" and
+        "trades" DataFrames, equity and positions are indexed by datetime
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    meta, stats = {}, None
+    tables = {"equity": [], "positions": [], "trades": []}
+    for header, columns in _read_chunks(data):
+        if header["table"] == "meta":
+            meta = header["meta"]
+        elif header["table"] == "stats":
+            stats = header["stats"]
+        else:
+            tables[header["table"]].append(columns)
+
+    def concat(chunks, names):
+        return {
+            name: np.concatenate([c[name] for c in chunks]) if chunks else np.empty(0)
+            for name in names
+        }
+
+    symbol_list = meta.get("symbol_list", [])
+    # an equity chunk without its positions chunk was cut short, keep what matches
+    rows = sum(len(c["total"]) for c in tables["equity"][: len(tables["positions"])])
+    equity = concat(tables["equity"], ["datetime", "cash", "total"])
+    index = pd.DatetimeIndex(equity["datetime"][:rows].astype("datetime64[ns]"), name="datetime")
+    trades = concat(tables["trades"], ["datetime", "symbol", "quantity", "price"])
+
+    return {
+        "meta": meta,
+        "stats": stats,
+        "equity": pd.DataFrame(
+            {"cash": equity["cash"][:rows], "total": equity["total"][:rows]}, index=index
+        ),
+        "positions": pd.DataFrame(concat(tables["positions"], symbol_list), index=index),
+        "trades": pd.DataFrame(
+            {
+                "datetime": trades["datetime"].astype("datetime64[ns]"),
+                "symbol": np.asarray(symbol_list, dtype=object)[
+                    trades["symbol"].astype(np.int64)
+                ],
+                "quantity": trades["quantity"],
+                "price": trades["price"],
+            }
+        ),
+    }
+
+
+def load_runs(paths):
+    """
+        loads many results files for comparison
+
+        Params:
+            paths:
+                list of results files or a directory of them
+
+        returns (stats, equity): DataFrame of one row per run of its meta and stats,
+        and DataFrame of the total of every run, one column per run, outer joined on
+        datetime. runs are named by their run_id, or file name without one
+    """
+    if isinstance(paths, str):
+        paths = sorted(glob.glob(os.path.join(paths, "*" + EXTENSION)))
+
+    rows, totals = {}, {}
+    for path in paths:
+        run = read_results(path)
+        name = run["meta"].get("run_id") or os.path.splitext(os.path.basename(path))[0]
+        row = {k: v for k, v in run["meta"].items() if k != "symbol_list"}
+        row.update(run["stats"] or {})
+        rows[name] = row
+        totals[name] = run["equity"]["total"]
+    return pd.DataFrame.from_dict(rows, orient="index"), pd.DataFrame(totals)
+
+
+def new_run_id():
+    return uuid.uuid4().hex[:12]
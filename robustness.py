@@ -0,0 +1,167 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import performance
+
+METRICS = ("total_return", "sharp_ratio", "max_drawdown", "drawdown_duration")
+
+
+def block_bootstrap(returns, n_resamples, block_size, rng):
+    """
+        (n_resamples, len(returns)) array, each row is made of blocks of block_size
+        consecutive returns starting at random bars, so short term autocorrelation
+        such as volatility clustering is kept within a block
+    """
+    n = len(returns)
+    n_blocks = -(-n // block_size)
+    starts = rng.integers(0, n - block_size + 1, size=(n_resamples, n_blocks))
+    index = (starts[:, :, None] + np.arange(block_size)).reshape(n_resamples, -1)[:, :n]
+    return returns[index]
+
+
+def shuffle_returns(returns, n_resamples, rng):
+    """
+        (n_resamples, len(returns)) array, each row is a random reordering of
+        returns, the total return is kept and only the path changes
+    """
+    return rng.permuted(np.broadcast_to(returns, (n_resamples, len(returns))), axis=1)
+
+
+def resample_stats(resampled, periods=252):
+    """
+        the summary stats of Portfolio.summary_stats for every row of a
+        (n_resamples, n_bars) array of returns at once
+
+        returns dict of metric name to array of n_resamples values
+    """
+    equity = np.cumprod(1.0 + resampled, axis=1)
+    _, max_drawdown, drawdown_duration = performance.drawdowns(equity)
+    return {
+        "total_return": equity[:, -1] - 1.0,
+        "sharp_ratio": performance.sharp_ratio(resampled, periods),
+        "max_drawdown": max_drawdown,
+        "drawdown_duration": drawdown_duration,
+    }
+
+
+def _run_batch(returns, method, n_resamples, block_size, seed, periods):
+    rng = np.random.default_rng(seed)
+    if method == "block_bootstrap":
+        resampled = block_bootstrap(returns, n_resamples, block_size, rng)
+    elif method == "shuffle":
+        resampled = shuffle_returns(returns, n_resamples, rng)
+    else:
+        raise ValueError("unknown method {}".format(method))
+    return resample_stats(resampled, periods)
+
+
+def run_robustness(
+    returns,
+    n_resamples=10000,
+    method="block_bootstrap",
+    block_size=20,
+    confidence=0.95,
+    workers=None,
+    batch_size=1000,
+    seed=0,
+    periods=252,
+):
+    """
+        Confidence intervals of the summary stats from resamples of a returns series
+
+        the resamples are generated and measured batch_size at a time as 2d arrays,
+        the batches run on a process pool. each batch has its own seed spawned from
+        seed so results do not depend on the number of workers
+
+        Params:
+            returns:
+                per bar returns, eg Portfolio.equity_curve["returns"], nan are dropped
+            method:
+                "block_bootstrap" resamples blocks of block_size bars with replacement
+                "shuffle" reorders the returns, as if the same trades came in another order
+            confidence:
+                width of the two sided interval, 0.95 gives the 2.5 and 97.5 percentiles
+            workers:
+                number of worker processes, None uses os.cpu_count(), 1 runs in process
+
+        returns DataFrame indexed by metric with columns observed, mean, lower, upper,
+        df.attrs["resamples_per_sec"] holds the throughput
+    """
+    returns = np.asarray(pd.Series(returns).dropna(), dtype=np.float64)
+    if method == "block_bootstrap" and not 0 < block_size <= len(returns):
+        raise ValueError("block_size must be between 1 and the number of returns")
+
+    sizes = [batch_size] * (n_resamples // batch_size)
+    if n_resamples % batch_size:
+        sizes.append(n_resamples % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [
+        (returns, method, size, block_size, s, periods) for size, s in zip(sizes, seeds)
+    ]
+
+    start = time.perf_counter()
+    if workers == 1:
+        batches = [_run_batch(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            batches = list(pool.map(_run_batch, *zip(*args)))
+    elapsed = time.perf_counter() - start
+
+    observed = resample_stats(returns[None, :], periods)
+    alpha = (1.0 - confidence) / 2.0
+    rows = {}
+    for metric in METRICS:
+        values = np.concatenate([b[metric] for b in batches])
+        rows[metric] = {
+            "observed": observed[metric][0],
+            "mean": np.nanmean(values),
+            "lower": np.nanquantile(values, alpha),
+            "upper": np.nanquantile(values, 1.0 - alpha),
+        }
+
+    results = pd.DataFrame.from_dict(rows, orient="index")
+    results.attrs["resamples_per_sec"] = n_resamples / elapsed
+    return results
+
+
+def portfolio_robustness(portfolio, **kwargs):
+    """
+        run_robustness of the returns of a portfolio whose backtest has run,
+        kwargs are passed to run_robustness
+    """
+    portfolio.create_equity_curve()
+    return run_robustness(portfolio.equity_curve["returns"], **kwargs)
+
+
+if __name__ == "__main__":
+    import os
+
+    from backtest import Backtest
+    from data import DataHandler
+    from execution import ExecutionHandler
+    from portfolio import Portfolio
+    from portfolioBalancingStrat import end_of_month_rebalance_stratergy
+
+    csv_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    backtest = Backtest(
+        csv_dir,
+        ["SPY", "IJS", "EFA", "EEM", "AGG", "JNK", "DJP", "RWR"],
+        100000,
+        None,
+        None,
+        DataHandler,
+        ExecutionHandler,
+        Portfolio,
+        end_of_month_rebalance_stratergy,
+        headless=True,
+    )
+    backtest._run_backtest()
+
+    for method in ("block_bootstrap", "shuffle"):
+        results = portfolio_robustness(backtest.portfolio, method=method)
+        print(method)
+        print(results)
+        print("{:,.0f} resamples/sec".format(results.attrs["resamples_per_sec"]))
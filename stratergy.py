@@ -5,9 +5,25 @@ import datetime
 
 
 class Stratergy:
+    """
+        lookback:
+            the largest number of bars the stratergy asks the data handler for at once,
+            the data handler only has to keep this many bars of history
+    """
+
+    lookback = 1
+
     def __init__(self):
         pass
 
+    @classmethod
+    def required_lookback(cls, **params):
+        """
+            the lookback an instance built with params will declare, used to size the
+            warmup history before the stratergy itself is created
+        """
+        return cls.lookback
+
     def calculate_signal(self):
         """
             Is trigered on a market event being put in the event que
@@ -18,17 +34,21 @@ class Stratergy:
 
 
 class SimpleStratergy(Stratergy):
-    def __init__(self, symbol, data, events):
+    lookback = 2
+
+    def __init__(self, data, events, symbol=None):
         """
             Params:
-                symbol: list of string symbols that are of interest
-                    ["AAPL", "BRW", ]
                 data: dataHandler of market data
                     dataHandler object
                 events: event queue
                     Queue object of Event()
+                symbol: string symbol that is of interest
+                    "AAPL", defaults to the first of data.symbol_list
 
         """
+        if symbol is None:
+            symbol = data.symbol_list[0]
         self.symbol = symbol
         self.data = data
         self.events = events
@@ -37,7 +57,7 @@ class SimpleStratergy(Stratergy):
 
         interested_bar_vals = self.data.get_bar_values(self.symbol, "adj_close", N=2)
         bar_date = self.data.get_latest_bar_datetime(self.symbol)
-        if len(interested_bar_vals) > 0:
+        if interested_bar_vals is not None:
             current_val = interested_bar_vals[-1]
             previous_val = interested_bar_vals[-2]
 
@@ -0,0 +1,289 @@
+import heapq
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from data import DataHandler
+from csv_cache import BAR_FIELDS
+from event import MarketEvent
+
+DEFAULT_LOOKBACK = 500
+
+
+class RollingBars:
+    """
+        Fixed size history of bars for one symbol
+
+        every bar is written twice, at slot and slot + capacity, so the last N
+        values of a field are always one contiguous slice of self.data
+
+        Data:
+            data:
+                Type:
+                    numpy float64 array of shape (n_fields, 2 * capacity)
+            count:
+                number of bars appended so far, only the last capacity are kept
+    """
+
+    def __init__(self, capacity, n_fields=len(BAR_FIELDS)):
+        self.capacity = capacity
+        self.data = np.full((n_fields, 2 * capacity), np.nan)
+        self.pos = 0
+        self.count = 0
+
+    def append(self, values):
+        self.data[:, self.pos] = values
+        self.data[:, self.pos + self.capacity] = values
+        self.pos = (self.pos + 1) % self.capacity
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def window(self, field_idx, N):
+        """
+            returns a contiguous view of the last N values of field_idx
+            N must be no more than len(self)
+        """
+        end = self.pos + self.capacity
+        return self.data[field_idx, end - N : end]
+
+    def latest(self, field_idx):
+        return self.data[field_idx, self.pos + self.capacity - 1]
+
+
+def iter_symbol_rows(
+    csv_path, symbol_idx, chunksize, start_date=None, end_date=None, keep_before=0
+):
+    """
+        reads a csv file chunksize rows at a time and yields
+        (datetime as int64 ns, symbol_idx, row values in BAR_FIELDS order)
+
+        keep_before:
+            number of the last rows before start_date yielded too, ahead of the rows
+            in range, eg 1 so a symbol can be padded forward from its last row
+    """
+    start = None if start_date is None else pd.Timestamp(start_date).value
+    end = None if end_date is None else pd.Timestamp(end_date).value
+    reader = pd.read_csv(
+        csv_path,
+        header=0,
+        index_col=0,
+        parse_dates=True,
+        names=["datetime"] + list(BAR_FIELDS),
+        chunksize=chunksize,
+    )
+    before = deque(maxlen=keep_before)
+    for chunk in reader:
+        times = chunk.index.values.astype("datetime64[ns]").view("i8")
+        values = chunk[list(BAR_FIELDS)].to_numpy(dtype=np.float64)
+        for i in range(len(times)):
+            if start is not None and times[i] < start:
+                if keep_before:
+                    before.append((times[i], symbol_idx, values[i]))
+                continue
+            while before:
+                yield before.popleft()
+            if end is not None and times[i] > end:
+                return
+            yield times[i], symbol_idx, values[i]
+    while before:
+        yield before.popleft()
+
+
+class StreamingDataHandler(DataHandler):
+    """
+        DataHandler for bar files larger than memory
+
+        each symbol file is read in chunks of chunksize rows and the symbols are
+        merged by datetime with a k-way heap merge as update_bars is called.
+        symbols with no bar at a datetime are padded forward from their last bar,
+        which may be before start_date, symbols that have not started yet are nan.
+        as DataHandler the warmup_bars bars before start_date are kept as history.
+
+        only the last lookback bars are kept per symbol so peak memory is bounded by
+        chunksize and lookback rather than by file size
+    """
+
+    def __init__(
+        self,
+        events,
+        csv_dir,
+        symbol_list,
+        start_date=None,
+        end_date=None,
+        chunksize=10000,
+        lookback=None,
+        warmup_bars=0,
+    ):
+        """
+            Params:
+                same as DataHandler
+                chunksize:
+                    number of csv rows read at a time per symbol
+                lookback:
+                    number of bars kept per symbol, the largest N get_bar_values can serve
+                    set_lookback, which Backtest calls with the largest lookback its
+                    stratergys declare, only ever raises it. when None and set_lookback
+                    is never called DEFAULT_LOOKBACK is used
+        """
+        self.chunksize = chunksize
+        self.lookback = lookback
+        super().__init__(
+            events, csv_dir, symbol_list, start_date, end_date, warmup_bars=warmup_bars
+        )
+
+    def open_convert_csv_files(self, symbol_list, csv_dir, start_date, end_date):
+        """
+            sets up the merged stream of rows, no bars are read until update_bars
+            other than the warmup bars before start_date
+        """
+        self._symbol_idx = {s: j for j, s in enumerate(symbol_list)}
+        self._stream = heapq.merge(
+            *[
+                iter_symbol_rows(
+                    os.path.join(csv_dir, "{}.csv".format(s)),
+                    j,
+                    self.chunksize,
+                    start_date,
+                    end_date,
+                    # a symbol's rows on the last warmup_bars datetimes are among its
+                    # last warmup_bars rows, one more seeds the padding before them
+                    keep_before=self.warmup_bars + 1,
+                )
+                for j, s in enumerate(symbol_list)
+            ],
+            key=lambda row: row[0],
+        )
+        self._next_row = next(self._stream, None)
+
+        # rows before start_date seed the values padded forward into the first bars,
+        # the bars of the last warmup_bars datetimes are kept for _allocate_history
+        self._last_values = np.full((len(symbol_list), len(BAR_FIELDS)), np.nan)
+        before = []
+        if start_date is not None:
+            start = pd.Timestamp(start_date).value
+            while self._next_row is not None and self._next_row[0] < start:
+                timestamp = self._next_row[0]
+                while self._next_row is not None and self._next_row[0] == timestamp:
+                    _, j, values = self._next_row
+                    self._last_values[j] = values
+                    self._next_row = next(self._stream, None)
+                before.append((pd.Timestamp(timestamp), self._last_values.copy()))
+        elif self._next_row is not None:
+            self.start_date = pd.Timestamp(self._next_row[0])
+
+        self._warmup = before[len(before) - min(self.warmup_bars, len(before)) :]
+        self.bar_cursor = len(self._warmup)
+        self.symbol_data = None
+
+    def set_lookback(self, lookback):
+        """
+            sizes the history kept per symbol to at least lookback, only allowed
+            before the first bar
+        """
+        if self.symbol_data is not None:
+            raise ValueError("lookback can only be set before the first bar")
+        if self.lookback is None or lookback > self.lookback:
+            self.lookback = lookback
+
+    def _allocate_history(self):
+        if self.lookback is None:
+            self.lookback = DEFAULT_LOOKBACK
+        self.symbol_data = {s: RollingBars(self.lookback) for s in self.symbol_list}
+        self._datetimes = deque(maxlen=self.lookback)
+        for timestamp, values in self._warmup:
+            for s, j in self._symbol_idx.items():
+                self.symbol_data[s].append(values[j])
+            self._datetimes.append(timestamp)
+        self._warmup = []
+
+    def get_state(self):
+        """
+            the kept history and position in the stream, used by checkpoint
+        """
+        return {
+            "bar_cursor": self.bar_cursor,
+            "finished": self.finished,
+            "lookback": self.lookback,
+            "symbol_data": self.symbol_data,
+            "datetimes": list(self._datetimes) if self.symbol_data is not None else None,
+            "last_values": self._last_values,
+        }
+
+    def set_state(self, state):
+        """
+            restores the history and skips the stream past the last bar read
+        """
+        self.bar_cursor = state["bar_cursor"]
+        self.finished = state["finished"]
+        self.lookback = state["lookback"]
+        self.symbol_data = state["symbol_data"]
+        self._last_values = state["last_values"]
+        if self.symbol_data is None:
+            return
+        self._datetimes = deque(state["datetimes"], maxlen=self.lookback)
+        if self._datetimes:
+            last = self._datetimes[-1].value
+            while self._next_row is not None and self._next_row[0] <= last:
+                self._next_row = next(self._stream, None)
+
+    def update_bars(self):
+        if self.symbol_data is None:
+            self._allocate_history()
+
+        if self._next_row is None:
+            print("finished backtest")
+            self.finished = True
+        else:
+            timestamp = self._next_row[0]
+            while self._next_row is not None and self._next_row[0] == timestamp:
+                _, j, values = self._next_row
+                self._last_values[j] = values
+                self._next_row = next(self._stream, None)
+
+            for s, j in self._symbol_idx.items():
+                self.symbol_data[s].append(self._last_values[j])
+            self._datetimes.append(pd.Timestamp(timestamp))
+            self.bar_cursor += 1
+            self.events.put(MarketEvent())
+
+    def get_latest_bars(self, symbol, N=1):
+        N = min(N, len(self._datetimes))
+        return [
+            self._get_bar(symbol, i) for i in range(self.bar_cursor - N, self.bar_cursor)
+        ]
+
+    def _get_bar(self, symbol, i):
+        # i is the bar number, only the last lookback bars are still held
+        back = self.bar_cursor - i
+        bars = self.symbol_data[symbol]
+        row = pd.Series(
+            {key: bars.window(k, back)[0] for k, key in enumerate(BAR_FIELDS)}
+        )
+        return (self._datetimes[-back], row)
+
+    def get_bar_values(self, symbol, key, N):
+        """
+            returns a read only view of the last N values of key, None if there
+            are not yet N bars or N is more than the lookback kept
+        """
+        bars = None
+        if N <= len(self.symbol_data[symbol]):
+            bars = self.symbol_data[symbol].window(BAR_FIELDS.index(key), N)
+            bars.flags.writeable = False
+        return bars
+
+    def get_latest_bar_value(self, symbol, key):
+        val = self.symbol_data[symbol].latest(BAR_FIELDS.index(key))
+        if np.isnan(val):
+            val = 0
+        return val
+
+    def get_latest_bar_datetime(self, symbol):
+        return self._datetimes[-1]
+
+    def is_listed(self, symbol):
+        return not np.isnan(self.symbol_data[symbol].latest(BAR_FIELDS.index("adj_close")))
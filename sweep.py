@@ -0,0 +1,207 @@
+import itertools
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from backtest import Backtest
+from csv_cache import BAR_FIELDS
+from data import DataHandler
+from execution import ExecutionHandler
+from panel import PanelDataHandler
+from portfolio import Portfolio
+
+# panel attached by each worker process, see _attach_shared_panel
+_worker_panel = None
+_worker_handles = None
+
+
+class SharedPanel:
+    """
+        Aligned price data of a universe copied once into shared memory
+
+        bars are laid out as in panel.build_panel, (n_bars, n_symbols, n_fields), so
+        workers can attach them zero copy and serve them through PanelDataHandler
+    """
+
+    def __init__(self, csv_dir, symbol_list, use_cache=False):
+        data = DataHandler(queue.Queue(), csv_dir, symbol_list, use_cache=use_cache)
+        shape = (data.num_bars, len(symbol_list), len(BAR_FIELDS))
+        datetimes = data.bar_index.values.astype("datetime64[ns]").view("i8")
+
+        self.bars_shm = shared_memory.SharedMemory(
+            create=True, size=max(int(np.prod(shape)) * 8, 1)
+        )
+        self.datetimes_shm = shared_memory.SharedMemory(
+            create=True, size=max(datetimes.nbytes, 1)
+        )
+        bars = np.ndarray(shape, dtype=np.float64, buffer=self.bars_shm.buf)
+        for j, s in enumerate(symbol_list):
+            for k, key in enumerate(BAR_FIELDS):
+                bars[:, j, k] = data.symbol_data[s][key]
+        np.ndarray(datetimes.shape, dtype=np.int64, buffer=self.datetimes_shm.buf)[
+            :
+        ] = datetimes
+
+        self.spec = {
+            "bars": self.bars_shm.name,
+            "datetimes": self.datetimes_shm.name,
+            "shape": shape,
+            "symbols": list(symbol_list),
+            "fields": list(BAR_FIELDS),
+        }
+
+    def close(self):
+        for shm in (self.bars_shm, self.datetimes_shm):
+            shm.close()
+            shm.unlink()
+
+
+def attach_panel(spec):
+    """
+        returns ((datetimes, symbols, fields, bars), handles) for a SharedPanel spec,
+        the arrays are read only views of the shared memory
+    """
+    bars_shm = shared_memory.SharedMemory(name=spec["bars"])
+    datetimes_shm = shared_memory.SharedMemory(name=spec["datetimes"])
+    bars = np.ndarray(spec["shape"], dtype=np.float64, buffer=bars_shm.buf)
+    bars.flags.writeable = False
+    datetimes = np.ndarray(
+        (spec["shape"][0],), dtype=np.int64, buffer=datetimes_shm.buf
+    ).view("datetime64[ns]")
+    panel = (datetimes, spec["symbols"], spec["fields"], bars)
+    return panel, (bars_shm, datetimes_shm)
+
+
+def _attach_shared_panel(spec):
+    # the handles are kept so the shared memory stays mapped for the worker's life
+    global _worker_panel, _worker_handles
+    _worker_panel, _worker_handles = attach_panel(spec)
+
+
+def run_combination(backtest_args, stratergy_cls, params, return_equity=False):
+    """
+        runs one backtest on the attached shared panel, returns a dict of the
+        params, summary stats and event counts
+
+        return_equity:
+            when True the dict also holds "equity", a Series of the holdings total
+            indexed by datetime
+    """
+    backtest = Backtest(
+        data_handler_cls=partial(PanelDataHandler, panel=_worker_panel),
+        stratergy_cls=stratergy_cls,
+        stratergy_params=params,
+        **backtest_args
+    )
+    backtest._run_backtest()
+
+    result = dict(params)
+    result.update(backtest.portfolio.summary_stats())
+    result.update(
+        {"signals": backtest.signals, "orders": backtest.orders, "fills": backtest.fills}
+    )
+    if return_equity:
+        curve = backtest.portfolio.equity_curve
+        result["equity"] = pd.Series(
+            curve["total"].to_numpy(), index=pd.DatetimeIndex(curve["datetime"])
+        )
+    return result
+
+
+def expand_grid(param_grid):
+    """
+        {"a": [1, 2], "b": [3]} -> [{"a": 1, "b": 3}, {"a": 2, "b": 3}]
+    """
+    names = list(param_grid)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*[param_grid[n] for n in names])
+    ]
+
+
+def run_sweep(
+    csv_dir,
+    symbol_list,
+    stratergy_cls,
+    param_grid,
+    inital_capital=100000,
+    start_date=None,
+    end_date=None,
+    workers=None,
+    execution_handler_cls=ExecutionHandler,
+    portfolio_cls=Portfolio,
+):
+    """
+        Runs stratergy_cls once for every combination of param_grid on a process pool
+
+        the csv files are loaded and aligned once into shared memory, each worker
+        attaches it zero copy, no plots are shown and no equity.csv is written
+
+        Params:
+            param_grid:
+                dictionary of stratergy keyword argument to list of values
+                {"ols_window": [30, 60], "zscore_high": [2.0, 3.0]}
+            workers:
+                number of worker processes, None uses os.cpu_count()
+
+        returns DataFrame with one row per combination, the params then the summary
+        stats, df.attrs["backtests_per_sec"] holds the throughput
+    """
+    combinations = expand_grid(param_grid)
+    backtest_args = {
+        "csv_dir": csv_dir,
+        "symbol_list": symbol_list,
+        "inital_capital": inital_capital,
+        "start_date": start_date,
+        "end_date": end_date,
+        "execution_handler_cls": execution_handler_cls,
+        "portfolio_cls": portfolio_cls,
+    }
+
+    start = time.perf_counter()
+    panel = SharedPanel(csv_dir, symbol_list)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_attach_shared_panel, initargs=(panel.spec,)
+        ) as pool:
+            rows = list(
+                pool.map(
+                    run_combination,
+                    itertools.repeat(backtest_args),
+                    itertools.repeat(stratergy_cls),
+                    combinations,
+                )
+            )
+    finally:
+        panel.close()
+    elapsed = time.perf_counter() - start
+
+    results = pd.DataFrame(rows)
+    results.attrs["backtests_per_sec"] = len(combinations) / elapsed
+    print(
+        "{} backtests in {:.2f}s, {:.2f} backtests/sec".format(
+            len(combinations), elapsed, results.attrs["backtests_per_sec"]
+        )
+    )
+    return results
+
+
+if __name__ == "__main__":
+    import os
+
+    from mrStrat import OLSMRStratergy
+
+    csv_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    results = run_sweep(
+        csv_dir,
+        ["EFA", "EEM"],
+        OLSMRStratergy,
+        {"ols_window": [30, 60, 90], "zscore_low": [0.5], "zscore_high": [2.0, 3.0]},
+        start_date="2008-01-01",
+    )
+    print(results)
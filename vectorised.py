@@ -0,0 +1,221 @@
+import numpy as np
+
+from my_utils import params_to_attr
+from event_bus import EventBus
+
+
+class VectorisedBacktest:
+    """
+        Alternative to Backtest for stratergys whose trades can be expressed as arrays
+        over the whole calendar
+
+        the stratergy must provide target_weights() returning a (n_bars, n_symbols)
+        array with a row of target ratios of total holdings on every bar it rebalances
+        and nan rows on every other bar. trades are modelled as in the event driven
+        Portfolio: on a rebalance bar each symbol is traded to
+        floor(ratio * total / adj_close) shares at that bar's adj_close, a negative
+        ratio is a short, and holdings
+        are marked to market at each bar before that bar's trades.
+
+        positions only change on rebalance bars, so holdings, cash and the equity curve
+        of every bar between two rebalances are computed with array operations and only
+        the rebalances themselves are stepped through.
+    """
+
+    @params_to_attr
+    def __init__(
+        self,
+        csv_dir,
+        symbol_list,
+        inital_capital,
+        start_date,
+        end_date,
+        data_handler_cls,
+        portfolio_cls,
+        stratergy_cls,
+        headless=False,
+        equity_path="equity.csv",
+    ):
+        """
+            Params:
+                same as Backtest, no execution handler is used
+                headless:
+                    when True simulate_trading never plots, so matplotlib is not
+                    imported and nothing blocks, for batch workers
+                equity_path:
+                    file simulate_trading writes the equity curve to, None writes nothing
+        """
+        self.events = EventBus()
+        self.data_handler = self.data_handler_cls(
+            self.events, self.csv_dir, self.symbol_list, self.start_date, self.end_date
+        )
+        self.portfolio = self.portfolio_cls(
+            self.data_handler, self.events, self.inital_capital
+        )
+        self.stratergy = self.stratergy_cls(self.data_handler, self.events)
+
+    def _prices(self):
+        """
+            (n_bars, n_symbols) adj_close, nan replaced by 0 as get_latest_bar_value does
+        """
+        prices = np.column_stack(
+            [self.data_handler.symbol_data[s]["adj_close"] for s in self.symbol_list]
+        )
+        return np.nan_to_num(prices, nan=0.0)
+
+    def _run_backtest(self):
+        """
+            fills self.positions and self.cash, the holdings after each bar's trades
+        """
+        first = self.data_handler.bar_cursor
+        prices = self._prices()[first:]
+        weights = self.stratergy.target_weights()[first:]
+        n_bars, n_symbols = prices.shape
+
+        self.positions = np.zeros((n_bars, n_symbols))
+        self.cash = np.zeros(n_bars)
+
+        current_positions = np.zeros(n_symbols)
+        current_cash = float(self.portfolio.starting_capital)
+        rebalance_bars = np.flatnonzero(~np.all(np.isnan(weights), axis=1))
+        segment_ends = np.append(rebalance_bars[1:], n_bars)
+
+        if len(rebalance_bars) == 0 or rebalance_bars[0] > 0:
+            self.cash[:] = current_cash
+        for t, end in zip(rebalance_bars, segment_ends):
+            price = prices[t]
+            total = current_cash
+            for j in range(n_symbols):
+                total += current_positions[j] * price[j]
+
+            ratio = np.nan_to_num(weights[t], nan=0.0)
+            target = np.zeros(n_symbols)
+            tradable = (ratio != 0) & (price > 0)
+            target[tradable] = np.floor(ratio[tradable] * total / price[tradable])
+
+            for j in np.flatnonzero(target != current_positions):
+                current_cash -= (target[j] - current_positions[j]) * price[j]
+            current_positions = target
+
+            self.positions[t:end] = current_positions
+            self.cash[t:end] = current_cash
+
+        self._fill_holdings(prices, first)
+
+    def _fill_holdings(self, prices, first):
+        """
+            marks the positions to market and writes the rows to portfolio.ledger
+            in the same form the event driven Portfolio does
+        """
+        n_bars = len(prices)
+        held = np.zeros_like(self.positions)
+        held[1:] = self.positions[:-1]
+        cash = np.empty(n_bars)
+        cash[0] = self.portfolio.starting_capital
+        cash[1:] = self.cash[:-1]
+
+        market_value = held * prices
+        total = cash.copy()
+        for j in range(len(self.symbol_list)):
+            total += market_value[:, j]
+
+        datetimes = self.data_handler.bar_index[first:]
+        # compared one by one, as Portfolio.update does, so a start_date given as a
+        # string never matches a bar
+        keep = np.array([d != self.data_handler.start_date for d in datetimes], dtype=bool)
+        self.portfolio.ledger.extend(
+            datetimes[keep], held[keep], market_value[keep], cash[keep], total[keep]
+        )
+        self.portfolio.metrics.extend(total[keep])
+
+    def simulate_trading(self):
+        """
+            Entry point for running the backtest
+        """
+        self._run_backtest()
+        stats = self.portfolio.output_summary_stats(self.equity_path)
+        print(stats)
+        if not self.headless:
+            self.portfolio.display_results()
+
+
+def compare_with_event_driven(
+    csv_dir,
+    symbol_list,
+    inital_capital,
+    start_date,
+    end_date,
+    data_handler_cls,
+    execution_handler_cls,
+    portfolio_cls,
+    stratergy_cls,
+):
+    """
+        runs the same stratergy through Backtest and VectorisedBacktest and
+        returns the largest absolute difference of the holdings totals
+    """
+    from backtest import Backtest
+
+    event_driven = Backtest(
+        csv_dir,
+        symbol_list,
+        inital_capital,
+        start_date,
+        end_date,
+        data_handler_cls,
+        execution_handler_cls,
+        portfolio_cls,
+        stratergy_cls,
+    )
+    event_driven._run_backtest()
+
+    vectorised = VectorisedBacktest(
+        csv_dir,
+        symbol_list,
+        inital_capital,
+        start_date,
+        end_date,
+        data_handler_cls,
+        portfolio_cls,
+        stratergy_cls,
+    )
+    vectorised._run_backtest()
+
+    expected = event_driven.portfolio.ledger
+    result = vectorised.portfolio.ledger
+    if len(expected) != len(result):
+        raise ValueError(
+            "event driven run has {} holdings, vectorised has {}".format(
+                len(expected), len(result)
+            )
+        )
+    n = len(expected)
+    if not np.array_equal(expected.datetimes[:n], result.datetimes[:n], equal_nan=True):
+        raise ValueError("holdings datetimes differ")
+    return np.abs(expected.total_curve() - result.total_curve()).max()
+
+
+if __name__ == "__main__":
+    import os
+
+    from data import DataHandler
+    from execution import ExecutionHandler
+    from portfolio import Portfolio
+    from portfolioBalancingStrat import end_of_month_rebalance_stratergy
+
+    csv_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    symbol_list = ["SPY", "IJS", "EFA", "EEM", "AGG", "JNK", "DJP", "RWR"]
+
+    max_diff = compare_with_event_driven(
+        csv_dir,
+        symbol_list,
+        100000,
+        None,
+        None,
+        DataHandler,
+        ExecutionHandler,
+        Portfolio,
+        end_of_month_rebalance_stratergy,
+    )
+    print("largest difference in total holdings: {}".format(max_diff))
+    assert max_diff < 1e-6
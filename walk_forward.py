@@ -0,0 +1,286 @@
+import hashlib
+import itertools
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from execution import ExecutionHandler
+from portfolio import Portfolio
+from sweep import SharedPanel, _attach_shared_panel, expand_grid, run_combination
+
+
+class WalkForward:
+    """
+        Walk forward optimisation of a stratergy's parameters
+
+        the calendar is cut into folds, each an in sample window of in_sample_bars
+        followed by an out of sample window of out_of_sample_bars, the next fold
+        starts out_of_sample_bars later. every combination of param_grid is run on
+        the in sample window, the best by objective is run on the out of sample
+        window and the out of sample equity of every fold is chained into one curve.
+
+        the data is loaded once into shared memory and every in sample grid is run
+        on one process pool. each fold's result is cached in cache_dir so extending
+        the data by another window only runs the new fold.
+    """
+
+    def __init__(
+        self,
+        csv_dir,
+        symbol_list,
+        stratergy_cls,
+        param_grid,
+        in_sample_bars,
+        out_of_sample_bars,
+        objective="sharp_ratio",
+        inital_capital=100000,
+        workers=None,
+        cache_dir=None,
+        execution_handler_cls=ExecutionHandler,
+        portfolio_cls=Portfolio,
+    ):
+        """
+            Params:
+                param_grid:
+                    dictionary of stratergy keyword argument to list of values
+                in_sample_bars, out_of_sample_bars:
+                    length of the windows in bars of the aligned calendar
+                objective:
+                    key of Portfolio.summary_stats maximised in sample
+                cache_dir:
+                    folder fold results are kept in, None disables the cache
+        """
+        self.csv_dir = csv_dir
+        self.symbol_list = symbol_list
+        self.stratergy_cls = stratergy_cls
+        self.param_grid = param_grid
+        self.in_sample_bars = in_sample_bars
+        self.out_of_sample_bars = out_of_sample_bars
+        self.objective = objective
+        self.inital_capital = inital_capital
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.execution_handler_cls = execution_handler_cls
+        self.portfolio_cls = portfolio_cls
+
+    def make_folds(self, calendar):
+        """
+            returns list of (in_start, in_end, out_start, out_end) datetimes
+            the last out of sample window may be shorter than out_of_sample_bars
+        """
+        folds = []
+        for first in itertools.count(0, self.out_of_sample_bars):
+            out_first = first + self.in_sample_bars
+            if out_first >= len(calendar):
+                break
+            out_last = min(out_first + self.out_of_sample_bars, len(calendar)) - 1
+            folds.append(
+                (
+                    calendar[first],
+                    calendar[out_first - 1],
+                    calendar[out_first],
+                    calendar[out_last],
+                )
+            )
+        return folds
+
+    def _fold_key(self, fold, data_digest):
+        key = repr(
+            (
+                self.stratergy_cls.__module__,
+                self.stratergy_cls.__qualname__,
+                self.portfolio_cls.__module__,
+                self.portfolio_cls.__qualname__,
+                self.execution_handler_cls.__module__,
+                self.execution_handler_cls.__qualname__,
+                sorted((k, list(v)) for k, v in self.param_grid.items()),
+                list(self.symbol_list),
+                self.inital_capital,
+                self.objective,
+                [str(d) for d in fold],
+                data_digest,
+            )
+        )
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _data_digest(self, calendar, bars, fold, warmup):
+        """
+            digest of the bars a fold reads, from warmup bars before its in sample
+            window to the end of its out of sample window, so a fold is rerun when
+            its prices change, eg adjusted closes rewritten by a new download
+        """
+        first = max(calendar.searchsorted(fold[0]) - warmup, 0)
+        last = calendar.searchsorted(fold[3]) + 1
+        digest = hashlib.sha1(calendar.values[first:last].tobytes())
+        digest.update(np.ascontiguousarray(bars[first:last]).tobytes())
+        return digest.hexdigest()
+
+    def _load_fold(self, key):
+        if self.cache_dir is None:
+            return None
+        path = os.path.join(self.cache_dir, "{}.pkl".format(key))
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def _save_fold(self, key, result):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, "{}.pkl".format(key))
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def _backtest_args(self, start_date, end_date, warmup):
+        return {
+            "csv_dir": self.csv_dir,
+            "symbol_list": self.symbol_list,
+            "inital_capital": self.inital_capital,
+            "start_date": start_date,
+            "end_date": end_date,
+            "execution_handler_cls": self.execution_handler_cls,
+            "portfolio_cls": self.portfolio_cls,
+            "warmup": warmup,
+        }
+
+    def _best(self, rows):
+        scores = [row[self.objective] for row in rows]
+        scores = [-np.inf if s is None or np.isnan(s) else s for s in scores]
+        best = rows[int(np.argmax(scores))]
+        return {name: best[name] for name in self.param_grid}
+
+    def run(self):
+        """
+            runs every fold not already cached
+
+            returns DataFrame with one row per fold of its windows, best params and
+            out of sample stats, the chained curve is left in self.equity_curve
+        """
+        combinations = expand_grid(self.param_grid)
+        panel = SharedPanel(self.csv_dir, self.symbol_list)
+        try:
+            calendar = pd.DatetimeIndex(
+                np.ndarray(
+                    (panel.spec["shape"][0],),
+                    dtype=np.int64,
+                    buffer=panel.datetimes_shm.buf,
+                ).view("datetime64[ns]")
+            )
+            bars = np.ndarray(
+                panel.spec["shape"], dtype=np.float64, buffer=panel.bars_shm.buf
+            )
+            folds = self.make_folds(calendar)
+            # the out of sample run loads up to this many bars before its window
+            warmup = max(
+                self.stratergy_cls.required_lookback(**params) for params in combinations
+            )
+            keys = [
+                self._fold_key(fold, self._data_digest(calendar, bars, fold, warmup))
+                for fold in folds
+            ]
+            del bars
+            results = [self._load_fold(key) for key in keys]
+            todo = [i for i, result in enumerate(results) if result is None]
+
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_attach_shared_panel,
+                initargs=(panel.spec,),
+            ) as pool:
+                # every in sample run of every new fold goes on the pool at once
+                jobs = [(i, params) for i in todo for params in combinations]
+                in_sample_rows = list(
+                    pool.map(
+                        run_combination,
+                        [self._backtest_args(*folds[i][:2], False) for i, _ in jobs],
+                        itertools.repeat(self.stratergy_cls),
+                        [params for _, params in jobs],
+                    )
+                )
+                grids = {i: [] for i in todo}
+                for (i, _), row in zip(jobs, in_sample_rows):
+                    grids[i].append(row)
+                best_params = {i: self._best(grids[i]) for i in todo}
+
+                # out of sample runs warm up on the bars before their window
+                out_of_sample_rows = list(
+                    pool.map(
+                        run_combination,
+                        [self._backtest_args(*folds[i][2:], True) for i in todo],
+                        itertools.repeat(self.stratergy_cls),
+                        [best_params[i] for i in todo],
+                        itertools.repeat(True),
+                    )
+                )
+        finally:
+            panel.close()
+
+        for i, row in zip(todo, out_of_sample_rows):
+            results[i] = {
+                "in_sample": grids[i],
+                "best_params": best_params[i],
+                "out_of_sample": row,
+            }
+            self._save_fold(keys[i], results[i])
+
+        self.fold_results = results
+        self.equity_curve = self._chain(results)
+        return self._summary(folds, results)
+
+    def _chain(self, results):
+        """
+            chains the out of sample returns of every fold into one equity curve
+        """
+        returns = []
+        for result in results:
+            equity = result["out_of_sample"]["equity"]
+            returns.append(equity.pct_change().iloc[1:])
+        returns = pd.concat(returns)
+        curve = pd.DataFrame({"returns": returns})
+        curve["equity_curve"] = (1.0 + curve["returns"]).cumprod()
+        curve["total"] = curve["equity_curve"] * self.inital_capital
+        return curve
+
+    def _summary(self, folds, results):
+        rows = []
+        for i, (fold, result) in enumerate(zip(folds, results)):
+            row = {
+                "fold": i,
+                "in_start": fold[0],
+                "in_end": fold[1],
+                "out_start": fold[2],
+                "out_end": fold[3],
+            }
+            row.update(result["best_params"])
+            row.update(
+                {
+                    k: v
+                    for k, v in result["out_of_sample"].items()
+                    if k not in self.param_grid and k != "equity"
+                }
+            )
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+
+    from mrStrat import OLSMRStratergy
+
+    csv_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    walk_forward = WalkForward(
+        csv_dir,
+        ["EFA", "EEM"],
+        OLSMRStratergy,
+        {"ols_window": [30, 60], "zscore_high": [2.0, 3.0]},
+        in_sample_bars=504,
+        out_of_sample_bars=252,
+        cache_dir=os.path.join(csv_dir, ".cache", "walk_forward"),
+    )
+    print(walk_forward.run())
+    print(walk_forward.equity_curve.tail())